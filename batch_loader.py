@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+
+class BatchLoader:
+    """
+    Mini-batch iterator over (X, Y).
+
+    Without shuffle, batches are views of X and Y (no copy). With shuffle,
+    rows are reordered by a seeded permutation every epoch, and gathered
+    block by block into two reused buffers; the next block is gathered on a
+    background thread while the current one is trained on. Batches are
+    contiguous views of the block buffer. Memory is two blocks, whatever
+    the size of X, so X can be a memory-mapped array larger than RAM.
+
+    shuffle="block" visits the blocks in a random order and shuffles the
+    rows within each block only: every block is one contiguous read of X,
+    and no permutation of all the rows is kept, for X on disk.
+    """
+
+    def __init__(self, X: np.ndarray, Y: np.ndarray,
+                 batch: int = 32,
+                 shuffle: bool | str = True,
+                 seed: int = None,
+                 prefetch: bool = True,
+                 block: int = 65536):
+        assert len(X) == len(Y), "X and Y have different length."
+        assert batch > 0, "invalid batch size."
+
+        self.X = X
+        self.Y = Y
+        self.batch = batch
+        self.shuffle = shuffle if batch < len(X) else False
+        self.rng = np.random.default_rng(seed)
+        self.prefetch = prefetch
+
+        # a block holds a whole number of batches.
+        self.block = max(1, block // batch) * batch
+        self.buffers = None
+
+    def __len__(self) -> int:
+        """number of batches in an epoch."""
+
+        return len(self.X) // self.batch + (1 if len(self.X) % self.batch else 0)
+
+    def __iter__(self) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """yield (x_batch, y_batch) of one epoch."""
+
+        if not self.shuffle:
+            for start in range(0, len(self.X), self.batch):
+                yield self.X[start:start + self.batch], self.Y[start:start + self.batch]
+            return
+
+        if self.buffers is None:
+            rows = min(self.block, len(self.X))
+            self.buffers = [
+                (np.empty((rows,) + self.X.shape[1:], self.X.dtype),
+                 np.empty((rows,) + self.Y.shape[1:], self.Y.dtype))
+                for _ in range(2)
+            ]
+
+        starts = range(0, len(self.X), self.block)
+        if self.shuffle == "block":
+            order = self.rng.permutation(len(starts))
+
+            def rows_of(i):
+                start = starts[order[i]]
+                return start + self.rng.permutation(min(self.block, len(self.X) - start))
+        else:
+            perm = self.rng.permutation(len(self.X))
+
+            def rows_of(i):
+                return perm[starts[i]:starts[i] + self.block]
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = None
+            for i in range(len(starts)):
+                if pending is None:
+                    rows = self.gather(rows_of(i), i % 2)
+                else:
+                    rows = pending.result()
+
+                if self.prefetch and i + 1 < len(starts):
+                    pending = pool.submit(self.gather, rows_of(i + 1), (i + 1) % 2)
+                else:
+                    pending = None
+
+                xb, yb = self.buffers[i % 2]
+                for s in range(0, rows, self.batch):
+                    end = min(s + self.batch, rows)
+                    yield xb[s:end], yb[s:end]
+
+    def gather(self, idx: np.ndarray, buf: int) -> int:
+        """copy rows idx of X, Y into buffer buf. return number of rows."""
+
+        xb, yb = self.buffers[buf]
+        n = len(idx)
+        np.take(self.X, idx, axis=0, out=xb[:n])
+        np.take(self.Y, idx, axis=0, out=yb[:n])
+        return n
@@ -0,0 +1,892 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import pickle
+import shutil
+import resource
+import secrets
+import subprocess
+import tempfile
+import tracemalloc
+import multiprocessing
+import numpy as np
+import pandas as pd
+from load_csv import load
+
+HOUSES = ["Gryffindor", "Hufflepuff", "Ravenclaw", "Slytherin"]
+COURSES = [
+    "Arithmancy", "Astronomy", "Herbology", "Defense Against the Dark Arts",
+    "Divination", "Muggle Studies", "Ancient Runes", "History of Magic",
+    "Transfiguration", "Potions", "Care of Magical Creatures", "Charms", "Flying"
+]
+
+
+def make_dataset(n_rows: int, n_extra: int = 0, seed: int = 0,
+                 nan_rate: float = 0.02) -> pd.DataFrame:
+    """
+    Args
+        n_rows: number of students
+        n_extra: number of extra course columns ("Course 0", ...)
+        seed: random seed
+        nan_rate: ratio of missing course scores
+
+    Return
+        synthetic dataset with the columns of dataset_train.csv. Course scores
+        follow the per-house mean/std of dataset_train.csv.
+    """
+
+    rng = np.random.default_rng(seed)
+    ref = load("datasets/dataset_train.csv")
+    assert ref is not None, "data load failure."
+
+    house_idx = rng.integers(len(HOUSES), size=n_rows)
+    data = {
+        "Index": np.arange(n_rows),
+        "Hogwarts House": np.array(HOUSES)[house_idx],
+        "First Name": rng.choice(ref["First Name"].unique(), n_rows),
+        "Last Name": rng.choice(ref["Last Name"].unique(), n_rows),
+        "Birthday": rng.choice(ref["Birthday"].unique(), n_rows),
+        "Best Hand": rng.choice(["Left", "Right"], n_rows),
+    }
+
+    grouped = ref.groupby("Hogwarts House")[COURSES]
+    mean = grouped.mean().loc[HOUSES].to_numpy()
+    std = grouped.std().loc[HOUSES].to_numpy()
+
+    courses = COURSES + [f"Course {i}" for i in range(n_extra)]
+    for i, course in enumerate(courses):
+        j = i % len(COURSES)
+        col = rng.normal(mean[house_idx, j], std[house_idx, j])
+        col[rng.random(n_rows) < nan_rate] = np.nan
+        data[course] = col
+
+    return pd.DataFrame(data)
+
+
+def write_dataset(path: str, n_rows: int, seed: int = 0, chunksize: int = 1_000_000) -> None:
+    """write a make_dataset() csv of n_rows, chunk by chunk so that 10M+ rows fit in memory."""
+
+    for i, start in enumerate(range(0, n_rows, chunksize)):
+        data = make_dataset(min(chunksize, n_rows - start), seed=seed + i)
+        data["Index"] += start
+        data.to_csv(path, index=False, header=(i == 0), mode="w" if i == 0 else "a")
+
+
+def timeit(func, *args, repeat: int = 3, **kwargs) -> float:
+    """return the best wall time (s) of func(*args, **kwargs)."""
+
+    best = np.inf
+    for _ in range(repeat):
+        t_s = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t_s)
+    return best
+
+
+def bench_describe(n_rows: int = 100_000, n_extra: int = 200, max_workers: int = None) -> None:
+    """print describe time with 1 to max_workers processes."""
+
+    from describe import describe
+
+    max_workers = max_workers or os.cpu_count()
+    data = make_dataset(n_rows, n_extra)
+    print(f"describe: {n_rows} rows, {data.shape[1]} columns, {os.cpu_count()} cpus")
+
+    base = None
+    workers = 1
+    while True:
+        t = timeit(describe, data, include="number", workers=workers)
+        base = base or t
+        print(f"workers {workers:3d}: {t:8.3f}s  speedup {base / t:5.2f}x")
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+
+
+def run_isolated(func, *args) -> tuple:
+    """
+    run func(*args) in a fresh interpreter.
+    return (result of func, peak RSS of that interpreter in MiB).
+    """
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(measure_rss, (func, *args))
+
+
+def measure_rss(func, *args) -> tuple:
+    ret = func(*args)
+    return ret, peak_rss()
+
+
+def peak_rss() -> float:
+    """peak RSS (MiB) of this process."""
+
+    # ru_maxrss survives exec() on linux, so it would include the parent.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_once(path: str, typed: bool, cache: bool) -> float:
+    from load_csv import load, HOGWARTS_SCHEMA
+
+    t_s = time.perf_counter()
+    data = load(path, HOGWARTS_SCHEMA if typed else None, cache=cache)
+    t = time.perf_counter() - t_s
+    assert data is not None, "data load failure."
+    return t
+
+
+def bench_load(n_rows: int = 1_000_000) -> None:
+    """print time and peak RSS of csv parsing and of cold/warm cached loads."""
+
+    from load_csv import get_cache_dir
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dataset.csv")
+        make_dataset(n_rows).to_csv(path, index=False)
+        print(f"load: {n_rows} rows, {os.path.getsize(path) / 2 ** 20:.1f} MiB csv")
+
+        for typed in (False, True):
+            shutil.rmtree(get_cache_dir(path), ignore_errors=True)
+            cases = [("csv", False), ("cold", True), ("warm", True)]
+            for name, cache in cases:
+                t, rss = run_isolated(load_once, path, typed, cache)
+                print(f"{'typed' if typed else 'untyped':8s} {name:5s}: {t:8.3f}s  peak RSS {rss:8.1f} MiB")
+
+
+def bench_propagate(n_rows: int = 100_000, n_feature: int = 7, iters: int = 200) -> None:
+    """print time and peak temporary memory per training step, before/after the fused kernel."""
+
+    from logreg_train import propagate, propagate_into, softmax_propagate_into, sgd_update, Workspace
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, n_feature))
+    y = rng.integers(len(HOUSES), size=n_rows).astype(np.int8)
+    Y = np.eye(len(HOUSES), dtype=np.int8)[y]
+    lr = 0.005
+
+    def step_alloc(w, b):
+        dw, db, cost = propagate(w, b, X, Y)
+        return w - lr * dw, b - lr * db
+
+    Z = np.empty((n_rows, len(HOUSES)))
+    dw = np.empty((len(HOUSES), n_feature))
+    db = np.empty(len(HOUSES))
+    update = sgd_update(lr)
+
+    def step_fused(w, b):
+        propagate_into(w, b, X, Y, Z, dw, db, with_cost=False)
+        update(w, b, dw, db)
+        return w, b
+
+    work = Workspace(n_rows, len(HOUSES))
+
+    def step_index(w, b):
+        propagate_into(w, b, X, y, Z, dw, db, with_cost=False, work=work)
+        update(w, b, dw, db)
+        return w, b
+
+    def step_softmax(w, b):
+        softmax_propagate_into(w, b, X, y, Z, dw, db, with_cost=False, work=work)
+        update(w, b, dw, db)
+        return w, b
+
+    print(f"propagate: {n_rows} rows, {n_feature} features, {len(HOUSES)} categories")
+    for name, step in (("propagate + copy update", step_alloc), ("propagate_into + in place", step_fused),
+                       ("propagate_into, class idx", step_index), ("softmax, class idx", step_softmax)):
+        w, b = np.zeros((len(HOUSES), n_feature)), np.zeros(len(HOUSES))
+        w, b = step(w, b)
+
+        t_s = time.perf_counter()
+        for _ in range(iters):
+            w, b = step(w, b)
+        t = (time.perf_counter() - t_s) / iters
+
+        tracemalloc.start()
+        step(w, b)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{name:26s}: {t * 1e3:8.3f} ms/step  peak temporaries {peak / 2 ** 20:8.2f} MiB")
+
+
+def bench_ovr(n_rows: int = 200_000, epoch: int = 200, max_workers: int = None) -> None:
+    """print GD training time of the joint model and of one-vs-rest on 1 to max_workers processes."""
+
+    from logreg_train import model
+
+    max_workers = max_workers or os.cpu_count()
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, 7))
+    Y = np.eye(len(HOUSES), dtype=np.int8)[rng.integers(len(HOUSES), size=n_rows)]
+    kwargs = dict(epoch=epoch, lr=0.005, print_cost=0, optimizer="GD")
+
+    print(f"ovr: {n_rows} rows, {epoch} GD epochs, {os.cpu_count()} cpus")
+
+    slowest = max(timeit(model, X, Y[:, c:c + 1], repeat=1, **kwargs) for c in range(len(HOUSES)))
+    print(f"slowest single category: {slowest:8.3f}s")
+
+    base = timeit(model, X, Y, repeat=1, **kwargs)
+    print(f"joint, 1 process       : {base:8.3f}s")
+
+    workers = 2
+    while workers <= max_workers:
+        t = timeit(model, X, Y, repeat=1, workers=workers, **kwargs)
+        print(f"ovr, {workers:3d} processes   : {t:8.3f}s  speedup {base / t:5.2f}x")
+        workers *= 2
+
+
+def bench_parallel(n_rows: int = 1_000_000, epoch: int = 50, max_workers: int = None) -> None:
+    """
+    print the scaling curve of data-parallel GD: time per epoch with the
+    rows split across 1 to max_workers local processes (pipes), and across
+    max_workers socket workers on localhost (distributed.py worker), against
+    GD in one process. Run with OPENBLAS_NUM_THREADS=1 (or the variable of
+    the BLAS in use) to compare one core per worker.
+    """
+
+    from logreg_train import model
+
+    max_workers = max_workers or os.cpu_count()
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, len(COURSES)))
+    y = rng.integers(len(HOUSES), size=n_rows).astype(np.int8)
+    kwargs = dict(epoch=epoch, lr=0.005, print_cost=0, optimizer="GD", n_category=len(HOUSES))
+
+    print(f"parallel: {n_rows} rows, {len(COURSES)} features, {epoch} GD epochs, {os.cpu_count()} cpus")
+
+    base = timeit(model, X, y, repeat=1, **kwargs) / epoch
+    print(f"GD, 1 process          : {base * 1e3:8.2f} ms/epoch")
+
+    workers = 1
+    while workers <= max_workers:
+        t = timeit(model, X, y, repeat=1, workers=workers, data_parallel=True, **kwargs) / epoch
+        print(f"pipes, {workers:3d} workers     : {t * 1e3:8.2f} ms/epoch  speedup {base / t:5.2f}x")
+        workers *= 2
+
+    # a fresh secret for the localhost workers, unless one is set
+    os.environ.setdefault("DSLR_AUTHKEY", secrets.token_hex(16))
+    ports = range(6100, 6100 + max_workers)
+    procs = [subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), "distributed.py"),
+                               "worker", f"localhost:{port}"], stdout=subprocess.PIPE, text=True)
+             for port in ports]
+    try:
+        for proc in procs:
+            proc.stdout.readline()
+        addresses = [("localhost", port) for port in ports]
+        t = timeit(model, X, y, repeat=1, workers=addresses, data_parallel=True, **kwargs) / epoch
+        print(f"sockets, {max_workers:3d} workers   : {t * 1e3:8.2f} ms/epoch  speedup {base / t:5.2f}x")
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+def bench_softmax(n_rows: int = 100_000, max_epoch: int = 500, target: int = 97) -> None:
+    """
+    print, for one-vs-rest sigmoids and softmax: full batch GD time per
+    epoch, epochs to target (%) train accuracy and to 1% of the initial
+    cost (the costs differ, so each is relative to its own start), and
+    Newton iterations to converge.
+    """
+
+    from logreg_train import model, predict_index
+    from feature_store import encode_labels
+    from pipeline import Preprocessor
+
+    data = make_dataset(n_rows)
+    X = Preprocessor(COURSES).fit(data).transform_frame(data)
+    y, _ = encode_labels(data["Hogwarts House"])
+    kwargs = dict(print_cost=0, n_category=len(HOUSES))
+    gd = dict(lr=0.5, optimizer="GD", **kwargs)
+
+    print(f"softmax: {n_rows} rows, {len(COURSES)} features, {len(HOUSES)} categories, GD lr {gd['lr']}")
+    for loss in ("ovr", "softmax"):
+        t = timeit(model, X, y, epoch=20, repeat=1, loss=loss, **gd) / 20
+
+        newton = []
+        timeit(model, X, y, repeat=1, epoch=100, tol=1e-6, optimizer="Newton", loss=loss,
+               callback=lambda event, info: newton.append(info["cost"]), **kwargs)
+
+        # one epoch per call, warm-started, until the target accuracy
+        w, b = np.zeros((len(HOUSES), X.shape[1])), np.zeros(len(HOUSES))
+        to_accuracy = f">{max_epoch}"
+        for i in range(1, max_epoch + 1):
+            w, b, _ = model(X, y, w, b, epoch=1, loss=loss, **gd)
+            if np.mean(predict_index(w, b, X) == y) * 100 >= target:
+                to_accuracy = i
+                break
+
+        costs = []
+        model(X, y, epoch=max_epoch, loss=loss, callback=lambda event, info: costs.append(info["cost"]), **gd)
+        close = np.flatnonzero(np.array(costs) <= costs[0] * 0.01)
+        to_cost = close[0] + 1 if len(close) else f">{max_epoch}"
+
+        print(f"{loss:8s}: GD {t * 1e3:8.3f} ms/epoch, {to_accuracy:>5} epochs to {target}%, "
+              f"{to_cost:>5} epochs to 1% of initial cost, Newton {len(newton):3d} iterations")
+
+
+def train_store(store: str, dtype: str, acc_dtype: str, epoch: int, batch: int) -> float:
+    """mini-batch GD on the feature store, in dtype. return seconds per epoch."""
+
+    from feature_store import open_store
+    from logreg_train import model
+
+    X, y, meta = open_store(store)
+    kwargs = dict(lr=0.01, print_cost=0, optimizer="BGD", shuffle=False, n_category=len(meta["classes"]),
+                  dtype=dtype, acc_dtype=acc_dtype)
+    model(X[:batch], y[:batch], epoch=1, **kwargs)
+    return timeit(model, X, y, repeat=1, epoch=epoch, batch=batch, **kwargs) / epoch
+
+
+def bench_dtype(n_rows: int = 1_000_000, epoch: int = 3, batch: int = 4096) -> None:
+    """
+    print training throughput and peak RSS in float64 and float32 (with
+    float32 or float64 sums) on a feature store of the same dtype, and the
+    accuracy and weight difference of the house classifier (Newton).
+    """
+
+    from load_csv import load, HOGWARTS_SCHEMA
+    from feature_store import write_store, encode_labels
+    from pipeline import Preprocessor, HOGWARTS_DERIVED
+    from logreg_train import model, predict_index, get_feature_data
+
+    cases = [("float64", "float64", None), ("float32", "float32", None), ("float32", "float32", "float64")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_dataset(n_rows)
+        pipeline = Preprocessor(COURSES).fit(data)
+        print(f"dtype: {n_rows} rows, {len(COURSES)} features, BGD batch {batch}")
+        for store_dtype in ("float64", "float32"):
+            write_store(os.path.join(tmp, store_dtype), data, COURSES, label="Hogwarts House",
+                        pipeline=pipeline, dtype=store_dtype)
+        del data
+
+        for store_dtype, dtype, acc_dtype in cases:
+            t, rss = run_isolated(train_store, os.path.join(tmp, store_dtype), dtype, acc_dtype, epoch, batch)
+            name = f"{dtype}" + (f" + {acc_dtype} sums" if acc_dtype else "")
+            print(f"{name:24s}: {t:8.3f} s/epoch  {n_rows / t:12.0f} rows/s  peak RSS {rss:8.1f} MiB")
+
+    train = load("datasets/dataset_train.csv", HOGWARTS_SCHEMA)
+    test = load("datasets/dataset_test.csv", HOGWARTS_SCHEMA)
+    assert train is not None and test is not None, "data load failure."
+    _, features = get_feature_data(train)
+    pipeline = Preprocessor(features, derived=HOGWARTS_DERIVED).fit(train)
+    y, classes = encode_labels(train["Hogwarts House"])
+
+    print(f"house classifier: {len(features)} features, Newton")
+    base = None
+    for _, dtype, acc_dtype in cases:
+        x, x_test = (pipeline.transform_frame(d, dtype=dtype) for d in (train, test))
+        w, b, _ = model(x, y, epoch=100, tol=1e-6, print_cost=0, optimizer="Newton", n_category=len(classes),
+                        dtype=dtype, acc_dtype=acc_dtype)
+        pred = predict_index(w, b, x_test)
+        base = base or (w, pred)
+        name = f"{dtype}" + (f" + {acc_dtype} sums" if acc_dtype else "")
+        print(f"{name:24s}: train accuracy {np.mean(predict_index(w, b, x) == y) * 100:6.2f}%  "
+              f"max |w - w64| {np.max(np.abs(w - base[0])):.2e}  "
+              f"test predictions changed {np.sum(pred != base[1])}")
+
+
+def bench_sparse(n_rows: int = 20_000, n_extra: int = 100, l1: float = 0.2, epoch: int = 300) -> None:
+    """
+    print the features kept, train accuracy, model file size and predict
+    time of a dense (l2) and a sparse (l1 + l2) GD model on a wide dataset.
+    """
+
+    from feature_store import encode_labels
+    from pipeline import Preprocessor
+    from logreg_train import model, predict_index, save
+    from logreg_predict import Predictor
+
+    data = make_dataset(n_rows, n_extra)
+    features = COURSES + [f"Course {i}" for i in range(n_extra)]
+    pipeline = Preprocessor(features).fit(data)
+    X = pipeline.transform_frame(data)
+    y, classes = encode_labels(data["Hogwarts House"])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dataset.csv")
+        data.to_csv(path, index=False)
+        print(f"sparse: {n_rows} rows, {len(features)} features, {os.path.getsize(path) / 2 ** 20:.1f} MiB csv, "
+              f"{epoch} GD epochs")
+
+        for name, penalty in (("l2", dict(l2=1e-4)), (f"l1 {l1} + l2", dict(l1=l1, l2=1e-4))):
+            w, b, _ = model(X, y, epoch=epoch, lr=0.5, print_cost=0, optimizer="GD", n_category=len(classes),
+                            **penalty)
+            model_path = os.path.join(tmp, "model.bin")
+            size = save(model_path, w, b, pipeline, classes)
+            predictor = Predictor(model_path)
+            with open(os.devnull, "w") as f:
+                t = timeit(predictor.predict_stream, path, f)
+            print(f"{name:14s}: {len(predictor.features):4d} features, "
+                  f"train accuracy {np.mean(predict_index(w, b, X) == y) * 100:6.2f}%, "
+                  f"model {size / 1024:6.1f} KiB, predict {t:7.3f}s")
+
+
+def build_store(path: str, store: str, stream: bool, chunksize: int) -> float:
+    """
+    feature store of csv path, loaded as a whole (load + write_store) or
+    streamed (write_store_csv). return seconds.
+    """
+
+    from load_csv import HOGWARTS_SCHEMA
+    from feature_store import write_store, write_store_csv
+    from pipeline import Preprocessor, HOGWARTS_DERIVED
+
+    start = time.perf_counter()
+    pipeline = Preprocessor(COURSES, derived=HOGWARTS_DERIVED)
+    if stream:
+        write_store_csv(store, path, pipeline, label="Hogwarts House", chunksize=chunksize)
+    else:
+        data = load(path, HOGWARTS_SCHEMA)
+        write_store(store, data, COURSES, label="Hogwarts House", pipeline=pipeline.fit(data))
+    return time.perf_counter() - start
+
+
+def train_epochs(store: str, shuffle, epoch: int, batch: int) -> float:
+    """BGD on the feature store. return seconds per epoch."""
+
+    from feature_store import open_store
+    from logreg_train import model
+
+    X, y, meta = open_store(store)
+    return timeit(model, X, y, repeat=1, epoch=epoch, batch=batch, lr=0.1, print_cost=0, optimizer="BGD",
+                  shuffle=shuffle, seed=0, n_category=len(meta["classes"])) / epoch
+
+
+def bench_stream(chunksize: int = 65536, epoch: int = 2, batch: int = 256) -> None:
+    """
+    print time and peak RSS of building the feature store from a csv
+    loaded in memory or streamed chunk by chunk, and of BGD epochs on the
+    store (shuffled rows or blocks), for growing csv sizes. The streamed
+    build should stay flat. The training RSS includes the pages of the
+    memory-mapped store, which are page cache the kernel reclaims when
+    memory is short.
+    """
+
+    print(f"stream: {len(COURSES)} features, BGD batch {batch}, chunks of {chunksize} rows")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dataset.csv")
+        store = os.path.join(tmp, "store")
+        for n_rows in (250_000, 1_000_000, 4_000_000):
+            write_dataset(path, n_rows)
+            size = os.path.getsize(path) / 2 ** 20
+            for name, stream in (("in memory", False), ("streamed", True)):
+                t, rss = run_isolated(build_store, path, store, stream, chunksize)
+                print(f"{n_rows:9d} rows ({size:7.1f} MiB csv) store {name:10s}: {t:8.2f}s  "
+                      f"peak RSS {rss:8.1f} MiB")
+            for shuffle in (True, "block"):
+                t, rss = run_isolated(train_epochs, store, shuffle, epoch, batch)
+                print(f"{n_rows:9d} rows ({size:7.1f} MiB csv) shuffle {str(shuffle):8s}: {t:8.2f} s/epoch  "
+                      f"peak RSS {rss:8.1f} MiB")
+
+
+def bench_search(n_config: int = 20, k: int = 5, epoch: int = 100, n_rows: int = 1600) -> None:
+    """print k-fold GD time of n_config configs, stacked against one model() per config and fold."""
+
+    from search import kfold, random_configs, stacked_fit
+    from logreg_train import model
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, 7))
+    y = rng.integers(len(HOUSES), size=n_rows).astype(np.int8)
+    Y = np.eye(len(HOUSES), dtype=np.int8)[y]
+    configs = random_configs(n_config, seed=0)
+    lr = np.array([c["lr"] for c in configs])
+    folds = kfold(n_rows, k, seed=0)
+
+    def serial():
+        for train_idx, _ in folds:
+            for c in configs:
+                model(X[train_idx], y[train_idx], epoch=epoch, lr=c["lr"], print_cost=0, optimizer="GD",
+                      n_category=len(HOUSES))
+
+    def stacked():
+        for train_idx, _ in folds:
+            W = np.zeros((n_config, len(HOUSES), X.shape[1]))
+            B = np.zeros((n_config, len(HOUSES)))
+            stacked_fit(X[train_idx], Y[train_idx], W, B, lr, np.zeros(n_config), epoch)
+
+    print(f"search: {n_config} configs x {k} folds, {epoch} GD epochs, {n_rows} rows")
+    base = timeit(serial, repeat=1)
+    print(f"one model() per config and fold: {base:8.3f}s")
+    t = timeit(stacked, repeat=1)
+    print(f"stacked, one matmul per fold   : {t:8.3f}s  speedup {base / t:5.2f}x")
+
+
+def bench_select(n_rows: int = 100_000, n_extra: int = 200) -> None:
+    """print feature selection time on a wide dataset."""
+
+    from feature_select import select_features
+
+    data = make_dataset(n_rows, n_extra)
+    print(f"select: {n_rows} rows, {data.shape[1]} columns")
+    t_s = time.perf_counter()
+    features, report = select_features(data)
+    t = time.perf_counter() - t_s
+    print(f"{t:8.3f}s  {len(features)} features selected of {len(report['separability'])}, "
+          f"{len(report['redundant'])} redundant: {', '.join(features)}")
+
+
+def predict_once(path: str, out: str, chunksize: int) -> float:
+    from logreg_predict import Predictor
+
+    t_s = time.perf_counter()
+    with open(out, "w") as f:
+        Predictor().predict_stream(path, f, chunksize)
+    return time.perf_counter() - t_s
+
+
+def bench_predict(n_rows: int = 1_000_000, chunksize: int = 100_000) -> None:
+    """print streaming prediction throughput and peak RSS. needs a trained model."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dataset.csv")
+        make_dataset(n_rows).to_csv(path, index=False)
+        out = os.path.join(tmp, "houses.csv")
+
+        t, rss = run_isolated(predict_once, path, out, chunksize)
+        print(f"predict: {n_rows} rows, chunksize {chunksize}: {t:8.3f}s  "
+              f"{n_rows / t:12.0f} rows/s  peak RSS {rss:8.1f} MiB")
+
+
+def cold_start(code: str, repeat: int = 5) -> float:
+    """best wall time (s) of a fresh interpreter running code."""
+
+    best = np.inf
+    for _ in range(repeat):
+        t_s = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        best = min(best, time.perf_counter() - t_s)
+    return best
+
+
+def bench_model(n_feature: int = 13) -> None:
+    """print size and cold-start load time of the model file against the old pickle."""
+
+    from model_file import save_model
+
+    rng = np.random.default_rng(0)
+    features = COURSES[:n_feature] + [f"Course {i}" for i in range(n_feature - len(COURSES))]
+    w = rng.normal(size=(len(HOUSES), n_feature))
+    b = rng.normal(size=len(HOUSES))
+    mean = pd.Series(rng.normal(size=n_feature), index=features)
+    std = pd.Series(rng.random(n_feature), index=features)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pkl = os.path.join(tmp, "param.pkl")
+        with open(pkl, "wb") as f:
+            pickle.dump([w, b, features, mean, std], f)
+        path = os.path.join(tmp, "model.bin")
+        save_model(path, w, b, features, mean, std, HOUSES)
+
+        base = cold_start("import numpy")
+        cases = [
+            ("pickle", pkl, f"import pickle; pickle.load(open({pkl!r}, 'rb'))"),
+            ("model file", path, f"from model_file import load_model; load_model({path!r})"),
+        ]
+        print(f"model: {len(HOUSES)} categories, {n_feature} features. cold start over 'import numpy' ({base:.3f}s)")
+        for name, path, code in cases:
+            t = cold_start(code)
+            print(f"{name:10s}: {os.path.getsize(path):8d} bytes  cold start {t:8.3f}s  ({t - base:+.3f}s)")
+
+
+def import_time(module: str) -> float:
+    """cumulative import time (s) of module in a fresh interpreter, from python -X importtime."""
+
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert proc.returncode == 0, proc.stderr.strip().splitlines()[-1]
+    # last line: "import time: self [us] | cumulative | module"
+    return int(proc.stderr.strip().splitlines()[-1].split("|")[1]) / 1e6
+
+
+def bench_imports(repeat: int = 5) -> None:
+    """print the best import time of the module of every dslr subcommand."""
+
+    from dslr import COMMANDS
+
+    print(f"imports: best of {repeat}, python -X importtime")
+    for command, (module, _) in COMMANDS.items():
+        try:
+            t = min(import_time(module) for _ in range(repeat))
+            print(f"{command:10s} {module:15s}: {t * 1e3:8.1f} ms")
+        except AssertionError as e:
+            print(f"{command:10s} {module:15s}: {e}")
+
+
+# benchmark suite. epochs are kept low, so that 10M rows stay practical.
+SUITE_CASES = ["describe", "load", "train", "predict"]
+SUITE_SIZES = [1_000, 100_000]
+# large tier (--large): its csv is ~3 GB and a full run takes tens of
+# minutes, so it is opt-in. Its baseline is a separate report.
+SUITE_LARGE = [10_000_000]
+TRAIN_CASES = {
+    "GD": dict(epoch=100, lr=0.005),
+    "SGD": dict(epoch=1, lr=0.005),
+    "BGD": dict(epoch=2, batch=50, lr=0.005),
+    "Momentum": dict(epoch=2, batch=1024, lr=0.005),
+    "Nesterov": dict(epoch=2, batch=1024, lr=0.005),
+    "Adam": dict(epoch=2, batch=1024, lr=0.005),
+    "Newton": dict(epoch=100, tol=1e-6),
+    "LBFGS": dict(epoch=100, tol=1e-6),
+}
+
+
+def suite_prepare(path: str, store: str, model_path: str) -> None:
+    """write the feature store of csv path, and a model trained on it for predict."""
+
+    from load_csv import load, HOGWARTS_SCHEMA
+    from feature_store import write_store, open_store
+    from logreg_train import get_feature_data, model
+    from model_file import save_model
+    from pipeline import Preprocessor, HOGWARTS_DERIVED
+
+    data = load(path, HOGWARTS_SCHEMA)
+    assert data is not None, "data load failure."
+    _, features = get_feature_data(data)
+    pipeline = Preprocessor(features, derived=HOGWARTS_DERIVED).fit(data)
+    write_store(store, data, features, label="Hogwarts House", pipeline=pipeline)
+    X, y, meta = open_store(store)
+    w, b, _ = model(X, y, print_cost=0, optimizer="Newton", tol=1e-6, n_category=len(meta["classes"]))
+    save_model(model_path, w, b, classes=meta["classes"], **pipeline.model_args())
+
+
+def suite_describe(path: str) -> float:
+    from load_csv import load
+    from describe import describe
+
+    data = load(path, cache=True)
+    t_s = time.perf_counter()
+    describe(data)
+    return time.perf_counter() - t_s
+
+
+def suite_load(path: str) -> float:
+    from load_csv import load, HOGWARTS_SCHEMA
+
+    t_s = time.perf_counter()
+    load(path, HOGWARTS_SCHEMA)
+    return time.perf_counter() - t_s
+
+
+def suite_train(store: str, optimizer: str) -> float:
+    from feature_store import open_store
+    from logreg_train import model
+
+    X, y, meta = open_store(store)
+    kwargs = dict(print_cost=0, optimizer=optimizer, seed=0, n_category=len(meta["classes"]),
+                  **TRAIN_CASES[optimizer])
+    # load the compiled SGD kernel (numba) before timing.
+    model(X[:8], y[:8], **kwargs)
+
+    t_s = time.perf_counter()
+    model(X, y, **kwargs)
+    return time.perf_counter() - t_s
+
+
+def suite_predict(path: str, model_path: str) -> float:
+    from logreg_predict import Predictor
+
+    t_s = time.perf_counter()
+    with open(os.devnull, "w") as f:
+        Predictor(model_path).predict_stream(path, f)
+    return time.perf_counter() - t_s
+
+
+def summarize(values: list[float]) -> dict:
+    """median and spread of repeated measures."""
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    return {
+        "median": float(median),
+        "min": float(np.min(values)),
+        "max": float(np.max(values)),
+        "iqr": float(q3 - q1),
+        "values": [float(v) for v in values],
+    }
+
+
+def measure(n_rows: int, repeat: int, warmup: int, func, *args) -> dict:
+    """
+    run func(*args) warmup + repeat times, each in a fresh interpreter.
+    func returns its measured wall time (s).
+
+    Return
+        wall time and peak RSS (MiB) summaries, and rows/s of the median time.
+    """
+
+    runs = [run_isolated(func, *args) for _ in range(warmup + repeat)][warmup:]
+    times = summarize([t for t, _ in runs])
+    return {
+        "rows": n_rows,
+        "time": times,
+        "rows_per_s": n_rows / times["median"],
+        "peak_rss_mib": summarize([rss for _, rss in runs]),
+    }
+
+
+def bench_suite(sizes: list[int] = None, cases: list[str] = None,
+                repeat: int = 5, warmup: int = 1, seed: int = 0) -> dict:
+    """
+    run the benchmark cases on synthetic datasets of every size (rows).
+    train runs every optimizer of TRAIN_CASES.
+
+    Return
+        {"meta": environment, "results": {"case/rows": measure()}}
+    """
+
+    sizes = sizes or SUITE_SIZES
+    cases = cases or SUITE_CASES
+    results = {}
+
+    for n_rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "dataset.csv")
+            store = os.path.join(tmp, "features")
+            model_path = os.path.join(tmp, "model.bin")
+            write_dataset(path, n_rows, seed)
+            if "train" in cases or "predict" in cases:
+                run_isolated(suite_prepare, path, store, model_path)
+
+            jobs = []
+            if "describe" in cases:
+                jobs.append(("describe", suite_describe, path))
+            if "load" in cases:
+                jobs.append(("load", suite_load, path))
+            if "train" in cases:
+                jobs += [(f"train/{opt}", suite_train, store, opt) for opt in TRAIN_CASES]
+            if "predict" in cases:
+                jobs.append(("predict", suite_predict, path, model_path))
+
+            for name, func, *args in jobs:
+                key = f"{name}/{n_rows}"
+                results[key] = measure(n_rows, repeat, warmup, func, *args)
+                r = results[key]
+                print(f"{key:24s}: {r['time']['median']:9.4f}s (iqr {r['time']['iqr']:.4f})  "
+                      f"{r['rows_per_s']:12.0f} rows/s  peak RSS {r['peak_rss_mib']['median']:8.1f} MiB",
+                      file=sys.stderr)
+
+    meta = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "repeat": repeat,
+        "warmup": warmup,
+        "seed": seed,
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.25) -> list[str]:
+    """return a message for every case whose median time is over baseline * (1 + tolerance)."""
+
+    slower = []
+    for key, r in report["results"].items():
+        if key not in baseline["results"]:
+            continue
+        base = baseline["results"][key]["time"]["median"]
+        t = r["time"]["median"]
+        if t > base * (1 + tolerance):
+            slower.append(f"{key}: {t:.4f}s vs baseline {base:.4f}s ({t / base - 1:+.0%})")
+    return slower
+
+
+def suite_main(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(prog="bench.py suite", description="run the benchmark suite.")
+    parser.add_argument("--sizes", default=",".join(map(str, SUITE_SIZES)),
+                        help="comma separated dataset sizes (rows), e.g. 1000,100000")
+    parser.add_argument("--large", action="store_true",
+                        help=f"also run the large tier, {','.join(map(str, SUITE_LARGE))} rows")
+    parser.add_argument("--cases", default=",".join(SUITE_CASES), help="comma separated cases")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench.json", help="json report")
+    parser.add_argument("--baseline", help="json report to compare with. slower cases fail the run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown ratio")
+    args = parser.parse_args(argv)
+
+    cases = args.cases.split(",")
+    unknown = set(cases) - set(SUITE_CASES)
+    assert not unknown, f"unknown cases: {', '.join(sorted(unknown))}"
+
+    sizes = [int(v) for v in args.sizes.split(",")] + (SUITE_LARGE if args.large else [])
+    report = bench_suite(sizes, cases,
+                         repeat=args.repeat, warmup=args.warmup, seed=args.seed)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report saved to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(report, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"slower: {line}", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+        print(f"no case slower than {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+def main():
+    try:
+        assert len(sys.argv) >= 2, "usage: python3 bench.py [suite|describe|load|propagate|ovr|parallel|softmax|dtype|sparse|stream|predict|model|imports|search|select] [args...]"
+
+        if sys.argv[1] == "suite":
+            suite_main(sys.argv[2:])
+            return
+
+        args = [int(v) for v in sys.argv[2:]]
+        match sys.argv[1]:
+            case "describe":
+                bench_describe(*args)
+            case "load":
+                bench_load(*args)
+            case "propagate":
+                bench_propagate(*args)
+            case "ovr":
+                bench_ovr(*args)
+            case "parallel":
+                bench_parallel(*args)
+            case "softmax":
+                bench_softmax(*args)
+            case "dtype":
+                bench_dtype(*args)
+            case "sparse":
+                bench_sparse(*args)
+            case "stream":
+                bench_stream(*args)
+            case "predict":
+                bench_predict(*args)
+            case "model":
+                bench_model(*args)
+            case "imports":
+                bench_imports(*args)
+            case "search":
+                bench_search(*args)
+            case "select":
+                bench_select(*args)
+            case _:
+                raise AssertionError(f"unknown benchmark: {sys.argv[1]}")
+
+    except Exception as e:
+        print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
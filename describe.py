@@ -1,13 +1,28 @@
 #!/usr/bin/python3
 
+import os
 import sys
+import numpy as np
 import pandas as pd
-from load_csv import load
-from typing import Any
+from load_csv import load, load_chunks, get_path
+from sketch import Moments, KLLSketch, CategoricalSketch
+from shm import create_shared, attach_shared, release
+from concurrent.futures import ProcessPoolExecutor
 
+# files up to this size (bytes) are described exactly by describe_csv.
+EXACT_LIMIT = 64 * 1024 * 1024
 
-def describe(data: pd.DataFrame, include=None, exclude=None) -> pd.DataFrame:
-    '''This function returns described data.'''
+
+def describe(data: pd.DataFrame, include=None, exclude=None,
+             percentiles: list[float] = None,
+             workers: int = 1,
+             approx: bool = False) -> pd.DataFrame:
+    '''This function returns described data.
+
+workers > 1 splits numeric columns across that many processes.
+approx estimates unique/top/freq of non-numeric columns in fixed memory.
+Numeric columns are summed in float64 (float32 ones too), datetime columns
+get count, mean, min, percentiles and max, as pandas.'''
 
     if not isinstance(data, pd.DataFrame):
         raise TypeError("invalid input type.")
@@ -22,158 +37,324 @@ def describe(data: pd.DataFrame, include=None, exclude=None) -> pd.DataFrame:
     if len(new_data.columns) == 0:
         raise ValueError("No data.")
 
-    empty_option = ["count"]
+    percentiles = get_percentiles(percentiles)
+
+    num_cols = [col for col in new_data.columns if is_numeric(new_data[col])]
+    date_cols = [col for col in new_data.columns if is_datetime(new_data[col])]
+    num_set = set(num_cols + date_cols)
+    obj_cols = [col for col in new_data.columns if col not in num_set]
+
+    # every numeric column at once: (n_stat, n_col)
+    num_stats = {}
+    if num_cols and workers > 1:
+        num_stats = dict(zip(num_cols, parallel_numeric_stats(new_data, num_cols, percentiles, workers).T))
+    elif num_cols:
+        arr = new_data[num_cols].to_numpy(dtype=np.float64)
+        num_stats = dict(zip(num_cols, numeric_stats(arr, percentiles).T))
+
+    date_stats = {col: datetime_stats(new_data[col], percentiles) for col in date_cols}
+    obj_stats = {col: categorical_stats(new_data[col], approx) for col in obj_cols}
+
+    return make_describe_frame(new_data.columns, num_stats, obj_stats, percentiles, date_stats)
+
+
+def describe_csv(path: str, include=None, exclude=None,
+                 percentiles: list[float] = None,
+                 exact: bool = None,
+                 chunksize: int = 100_000,
+                 error: float = 0.01,
+                 capacity: int = 1000) -> pd.DataFrame:
+    """
+    Describe a csv file chunk by chunk, with memory bounded by chunksize.
+
+    Args
+        path: csv file path
+        include, exclude, percentiles: same as describe()
+        exact: load the whole file and use describe(). None for exact mode
+               only on files smaller than EXACT_LIMIT bytes.
+        chunksize: number of rows in memory at once
+        error: rank error bound of the percentiles
+        capacity: number of values tracked for unique/top/freq
+
+    Return
+        described data. count, mean, std, min and max are exact.
+        percentiles are within the given rank error. unique (HyperLogLog)
+        and top/freq (SpaceSaving) are approximate once a column has more
+        than capacity distinct values.
+    """
+
+    if exact is None:
+        exact = os.path.getsize(get_path(path)) <= EXACT_LIMIT
+
+    if exact:
+        data = load(path)
+        if data is None:
+            raise ValueError("data load failure.")
+        return describe(data, include=include, exclude=exclude, percentiles=percentiles)
+
+    # the first chunk fixes the type of every column.
+    head = next(load_chunks(path, chunksize), None)
+    if head is None or head.size == 0:
+        raise ValueError("Empty data.")
+
+    if include is not None or exclude is not None:
+        head = head.select_dtypes(include=include, exclude=exclude)
+
+    if len(head.columns) == 0:
+        raise ValueError("No data.")
+
+    percentiles = get_percentiles(percentiles)
+
+    num_cols = [col for col in head.columns if is_numeric(head[col])]
+    num_set = set(num_cols)
+    obj_cols = [col for col in head.columns if col not in num_set]
+    dtype = dict.fromkeys(num_cols, np.float64) | dict.fromkeys(obj_cols, object)
+
+    moments = Moments(len(num_cols))
+    quantiles = [KLLSketch(error) for _ in num_cols]
+    counters = {col: CategoricalSketch(capacity) for col in obj_cols}
+
+    for chunk in load_chunks(path, chunksize, dtype=dtype):
+        if num_cols:
+            arr = chunk[num_cols].to_numpy(dtype=np.float64)
+            moments.update(arr)
+            for i, sketch in enumerate(quantiles):
+                sketch.update(arr[:, i])
+
+        for col in obj_cols:
+            counters[col].update(chunk[col])
+
+    num_stats = {}
+    std = moments.std()
+    for i, col in enumerate(num_cols):
+        if moments.count[i] == 0:
+            num_stats[col] = np.full(len(percentiles) + 5, np.nan)
+            num_stats[col][0] = 0
+            continue
+
+        pct = quantiles[i].quantile(percentiles)
+        pct[percentiles == 0] = moments.min[i]
+        pct[percentiles == 1] = moments.max[i]
+        num_stats[col] = np.concatenate([
+            [moments.count[i], moments.mean[i], std[i], moments.min[i]],
+            pct,
+            [moments.max[i]]
+        ])
+
+    obj_stats = {col: counters[col].stats() for col in obj_cols}
+
+    return make_describe_frame(head.columns, num_stats, obj_stats, percentiles)
+
+
+def make_describe_frame(columns: pd.Index, num_stats: dict, obj_stats: dict,
+                        percentiles: np.ndarray, date_stats: dict = None) -> pd.DataFrame:
+    """
+    Args
+        columns: columns of the result, in order
+        num_stats: column -> count, mean, std, min, percentiles..., max
+        obj_stats: column -> count, unique, top, freq
+        percentiles: percentiles of num_stats and date_stats
+        date_stats: column -> count, mean, min, percentiles..., max
+
+    Return
+        described data, in the row order of pandas DataFrame.describe
+    """
+
+    date_stats = date_stats or {}
+    pct_option = format_percentiles(percentiles)
     obj_option = ["count", "unique", "top", "freq"]
-    num_option = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
-    all_option = ["count", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]
-
-    ret = pd.DataFrame()
-    for col in new_data.columns:
-        column = new_data[col]
-        if column.dtype in ["int64", "float64"]:
-            column.dropna(inplace=True)
-            
-            if column.size:
-                stats = [
-                    column.size,
-                    ft_mean(column),
-                    ft_std(column),
-                    ft_min(column),
-                    ft_quartile(column, 0.25),
-                    ft_quartile(column, 0.5),
-                    ft_quartile(column, 0.75),
-                    ft_max(column)
-                ]
-
-                tmp = pd.DataFrame(stats, index=num_option, columns=[col])
-
-            else:
-                stats = [0]
-                tmp = pd.DataFrame(stats, index=empty_option, columns=[col])
-
-        else:
-            unique_lst = list(column.unique())
-
-            cnt_dict = dict(zip(unique_lst, [0] * len(unique_lst)))
-            for elem in column:
-                cnt_dict[elem] += 1
-
-            most_elem = unique_lst[0]
-            most_elem_cnt = cnt_dict[most_elem]
-            for k, v in cnt_dict.items():
-                if most_elem_cnt < v:
-                    most_elem_cnt = v
-                    most_elem = k
-
-            stats = [
-                len(column),
-                len(unique_lst),
-                most_elem,
-                most_elem_cnt
-            ]
-            tmp = pd.DataFrame(stats, index=obj_option, columns=[col])
+    date_option = ["count", "mean", "min"] + pct_option + ["max"]
+    num_option = ["count", "mean", "std", "min"] + pct_option + ["max"]
+
+    if not obj_stats and not date_stats:
+        return pd.DataFrame(np.array([num_stats[col] for col in columns]).T,
+                            index=num_option, columns=columns)
+
+    # rows of the shortest kind first (pandas reorder_columns)
+    kinds = [(obj_option, obj_stats), (date_option, date_stats), (num_option, num_stats)]
+    index = list(dict.fromkeys(name for option, stats in kinds if stats for name in option))
+
+    # build the result once, instead of merging it column by column.
+    ret = {}
+    for col in columns:
+        option, stats = next((option, stats[col]) for option, stats in kinds if col in stats)
+        row = dict(zip(option, stats))
+        ret[col] = [row.get(name, np.nan) for name in index]
+
+    return pd.DataFrame(ret, index=index, columns=columns)
+
+
+def is_numeric(column: pd.Series) -> bool:
+    """return True if the column is described with numeric statistics."""
+
+    return (
+        pd.api.types.is_numeric_dtype(column.dtype) and
+        not pd.api.types.is_bool_dtype(column.dtype)
+    )
+
+
+def is_datetime(column: pd.Series) -> bool:
+    """return True if the column is described with datetime statistics."""
+
+    return pd.api.types.is_datetime64_any_dtype(column.dtype)
+
 
-        ret = ret.merge(tmp, left_index=True, right_index=True, how='outer')
+def get_percentiles(percentiles: list[float] = None) -> np.ndarray:
+    """return sorted unique percentiles, always including the median."""
 
-    if len(ret.index) == len(all_option):
-        ret = ret.reindex(all_option)
+    if percentiles is None:
+        return np.array([0.25, 0.5, 0.75])
 
-    elif len(ret.index) == len(num_option):
-        ret = ret.reindex(num_option)
+    percentiles = np.asarray(percentiles, dtype=np.float64)
+    if ((percentiles < 0) | (percentiles > 1)).any():
+        raise ValueError("percentiles should all be in the interval [0, 1].")
 
-    return ret
+    return np.unique(np.append(percentiles, 0.5))
 
 
-def ft_mean(args: Any) -> float:
-    """return mean values from given args."""
-    if (
-        len(args) == 0 or
-        not all(map(lambda x: isinstance(x, (int, float)), args))
-    ):
-        raise ValueError("ft_mean")
-    return sum(args) / len(args)
+def format_percentiles(percentiles: np.ndarray) -> list[str]:
+    """return row names of given percentiles. (0.25 -> '25%')"""
 
+    return [f"{p * 100:g}%" for p in percentiles]
 
-def ft_quartile(args: Any, p: float) -> list[float]:
-    """return quartile values(25%, 75%) from given args."""
-    if not isinstance(p, (int, float)):
-        raise TypeError("Please check input type.")
 
-    if (
-        len(args) == 0 or
-        not all(map(lambda x: isinstance(x, (int, float)), args)) or
-        p > 1 or p < 0
-    ):
-        raise ValueError("Please check input value.")
+def numeric_stats(arr: np.ndarray, percentiles: np.ndarray) -> np.ndarray:
+    """
+    Args
+        arr: numeric data (n_data, n_col). NaN is treated as missing.
+        percentiles: percentiles to compute, in [0, 1]
 
-    args = sorted(args)
-    if len(args) == 1:
-        return args[0]
+    Return
+        stats: count, mean, std, min, percentiles..., max (n_stat, n_col)
+    """
 
-    vidx = p * (len(args) - 1) + 1
-    i = int(vidx)
+    n_col = arr.shape[1]
+
+    # one sort per column, shared by min, max and every percentile.
+    # NaN values are sorted to the end of each column.
+    sorted_arr = np.sort(arr, axis=0)
+    count = arr.shape[0] - np.isnan(sorted_arr).sum(axis=0)
+
+    stats = np.full((len(percentiles) + 5, n_col), np.nan)
+    stats[0] = count
+
+    valid = count > 0
+    if not valid.any():
+        return stats
+
+    cols = np.arange(n_col)[valid]
+    n = count[valid]
+    data = sorted_arr[:, valid]
+
+    mean = np.nansum(data, axis=0) / n
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = np.nansum((data - mean) ** 2, axis=0) / (n - 1)
+
+    stats[1, cols] = mean
+    stats[2, cols] = np.sqrt(var)
+    stats[3, cols] = data[0]
+    stats[-1, cols] = data[n - 1, np.arange(len(n))]
+
+    # linear interpolation between closest ranks, like pandas.
+    for i, p in enumerate(percentiles):
+        pos = p * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, n - 1)
+        low_val = data[lo, np.arange(len(n))]
+        high_val = data[hi, np.arange(len(n))]
+        stats[4 + i, cols] = low_val + (high_val - low_val) * (pos - lo)
+
+    return stats
+
+
+def shared_numeric_stats(spec: tuple, start: int, stop: int, percentiles: np.ndarray) -> np.ndarray:
+    """numeric_stats() of columns [start, stop) of a shared array. (runs in a worker)"""
+
+    shm, arr = attach_shared(spec)
+    try:
+        return numeric_stats(arr[:, start:stop], percentiles)
+    finally:
+        del arr
+        shm.close()
+
+
+def parallel_numeric_stats(data: pd.DataFrame, num_cols: list, percentiles: np.ndarray,
+                           workers: int) -> np.ndarray:
+    """
+    numeric_stats() with columns split across worker processes.
+
+    The columns are written once to a column-major shared memory block, so
+    every worker reads a contiguous slice and nothing but the small stats
+    arrays is pickled.
+    """
+
+    n_col = len(num_cols)
+    workers = min(workers, n_col)
+    bounds = np.linspace(0, n_col, workers + 1).astype(int)
+
+    shm, arr, spec = create_shared((len(data), n_col), np.float64, order="F")
+    try:
+        for i, col in enumerate(num_cols):
+            arr[:, i] = data[col].to_numpy(dtype=np.float64)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(shared_numeric_stats, spec, start, stop, percentiles)
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ]
+            return np.concatenate([f.result() for f in futures], axis=1)
+    finally:
+        del arr
+        release(shm)
 
-    return args[i - 1] + (args[i] - args[i - 1]) * (vidx - i)
 
+def datetime_stats(column: pd.Series, percentiles: np.ndarray) -> list:
+    """return count, mean, min, percentiles..., max of given datetime column,
+    as Timestamps. NaT is not counted."""
 
-def ft_std(args: Any) -> float:
-    """return standard deviation value from given args."""
-    if (
-        len(args) == 0 or
-        not all(map(lambda x: isinstance(x, (int, float)), args))
-    ):
-        raise ValueError("ft_std")
-    return ft_var(args) ** 0.5
+    valid = column.dropna()
+    if len(valid) == 0:
+        return [0] + [pd.NaT] * (len(percentiles) + 3)
 
+    return [len(valid), valid.mean(), valid.min()] + valid.quantile(percentiles).tolist() + [valid.max()]
 
-def ft_var(args: Any) -> float:
-    """return variance value from given args."""
-    if (
-        len(args) == 0 or
-        not all(map(lambda x: isinstance(x, (int, float)), args))
-    ):
-        raise ValueError("ft_var")
-    m = ft_mean(args)
-    tmp = [(m - v) ** 2 for v in args]
 
-    return sum(tmp) / (len(tmp) - 1)
+def categorical_stats(column: pd.Series, approx: bool = False) -> list:
+    """
+    return count, unique, top, freq of given column. NaN is not counted.
 
+    approx uses CategoricalSketch (fixed memory) instead of exact counting.
+    """
 
-def ft_min(args: Any) -> float:
-    """return min value from given args."""
-    if (
-        len(args) == 0 or
-        not all(map(lambda x: isinstance(x, (int, float)), args))
-    ):
-        raise ValueError("ft_min")
+    if approx:
+        sketch = CategoricalSketch()
+        sketch.update(column)
+        return sketch.stats()
 
-    v = args[0]
-    for arg in args:
-        if v > arg:
-            v = arg
-    return v
+    # codes follow the order of first appearance, -1 for NaN.
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    codes = codes[codes >= 0]
+    if len(codes) == 0:
+        return [0, 0, np.nan, np.nan]
 
+    counts = np.bincount(codes, minlength=len(uniques))
 
-def ft_max(args: Any) -> float:
-    """return max value from given args."""
-    if (
-        len(args) == 0 or
-        not all(map(lambda x: isinstance(x, (int, float)), args))
-    ):
-        raise ValueError("ft_max")
+    # argmax returns the first of ties, i.e. the value seen first.
+    top = int(np.argmax(counts))
 
-    v = args[0]
-    for arg in args:
-        if v < arg:
-            v = arg
-    return v
+    return [
+        len(codes),
+        len(uniques),
+        uniques[top],
+        int(counts[top])
+    ]
 
 
 def main():
 
     try:
-        data = load("./datasets/dataset_train.csv")
-        data = load("./datasets/dataset_test.csv")
+        data = load("./datasets/dataset_train.csv", cache=True)
+        data = load("./datasets/dataset_test.csv", cache=True)
 
         print("Describe all data:")
         print(describe(data))
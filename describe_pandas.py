@@ -1,15 +1,16 @@
 #!/usr/bin/python3
 
 import sys
+import numpy as np
 import pandas as pd
-from load_csv import load
+from load_csv import load, HOGWARTS_SCHEMA
 from describe import describe
 
 
 def main():
 
     try:
-        data = load("./datasets/dataset_train.csv")
+        data = load("./datasets/dataset_train.csv", cache=True)
 
         print("Describe all data:")
         print(describe(data).to_string() == data.describe(include='all').to_string())
@@ -21,6 +22,19 @@ def main():
 
         print("Describe non numeric data:")
         print(describe(data, exclude='number').to_string() == data.describe(exclude='number').to_string())
+        print()
+
+        # typed load: datetime Birthday, float32 courses. describe sums
+        # float32 in float64, pandas in float32: compare with float64 columns.
+        typed = load("./datasets/dataset_train.csv", HOGWARTS_SCHEMA, cache=True)
+        wide = typed.astype({col: np.float64 for col in typed.columns if typed[col].dtype == np.float32})
+
+        print("Describe all typed data:")
+        print(describe(typed).to_string() == wide.describe(include='all').to_string())
+        print()
+
+        print("Describe non numeric typed data:")
+        print(describe(typed, exclude='number').to_string() == wide.describe(exclude='number').to_string())
 
     except Exception as e:
         print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import multiprocessing
+import numpy as np
+from multiprocessing.connection import Connection, Listener, Client
+from shm import share_array, attach_shared, release
+
+PORT = 6000
+
+# command of a step message, sent as its first value
+STOP, GRADIENT, GRADIENT_COST = 0, 1, 2
+
+
+def serve(conn: Connection) -> None:
+    """
+    data-parallel GD worker, on one connection (pipe or socket).
+
+    The first message is the shard: shared memory specs and a row range
+    (local worker), or the rows themselves (socket worker). Then every step
+    message is [command, w, b], answered with the sums over the shard
+    [dw * m, db * m, cost * m] (m: rows of the shard), which the
+    coordinator adds up. Steps are raw bytes, without pickling.
+    """
+
+    from logreg_train import propagate_into, softmax_propagate_into, Workspace
+
+    shms = []
+    X = Y = None
+    try:
+        init = conn.recv()
+        if "x_spec" in init:
+            x_shm, X = attach_shared(init["x_spec"])
+            shms.append(x_shm)
+            y_shm, Y = attach_shared(init["y_spec"])
+            shms.append(y_shm)
+            start, stop = init["rows"]
+            X, Y = X[start:stop], Y[start:stop]
+        else:
+            X, Y = init["x"], init["y"]
+
+        k, n = init["shape"]
+        m = len(X)
+        theta = np.empty(1 + k * n + k, dtype=init["dtype"])
+        w, b = theta[1:1 + k * n].reshape(k, n), theta[1 + k * n:]
+        out = np.zeros(k * n + k + 1, dtype=init["acc_dtype"])
+        dw, db = out[:k * n].reshape(k, n), out[k * n:-1]
+        Z = np.empty((m, k), dtype=theta.dtype)
+        work = Workspace(m, k, theta.dtype)
+        step = softmax_propagate_into if init["loss"] == "softmax" else propagate_into
+
+        while True:
+            conn.recv_bytes_into(theta)
+            if theta[0] == STOP:
+                break
+            if m:
+                cost = step(w, b, X, Y, Z, dw, db, with_cost=theta[0] == GRADIENT_COST, work=work)
+                out[:-1] *= m
+                out[-1] = 0 if cost is None else cost * m
+            conn.send_bytes(out)
+    finally:
+        del X, Y
+        for shm in shms:
+            shm.close()
+        conn.close()
+
+
+def get_authkey() -> bytes:
+    """
+    DSLR_AUTHKEY, the secret shared by the coordinator and the socket
+    workers. Messages are pickled, so a socket is never opened without it.
+    """
+
+    key = os.environ.get("DSLR_AUTHKEY")
+    assert key, "DSLR_AUTHKEY is not set: socket workers need a shared secret."
+    return key.encode()
+
+
+def start_local(n: int) -> tuple[list[Connection], list[multiprocessing.Process]]:
+    """start n local workers. return their pipes and processes."""
+
+    conns, procs = [], []
+    for _ in range(n):
+        parent, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=serve, args=(child,), daemon=True)
+        proc.start()
+        child.close()
+        conns.append(parent)
+        procs.append(proc)
+    return conns, procs
+
+
+def parallel_gd(w: np.ndarray, b: np.ndarray,
+                X: np.ndarray, Y: np.ndarray,
+                workers,
+                epoch: int = 1,
+                lr: float = 0.001,
+                print_cost: int = 0,
+                tol: float = 0,
+                callback=None,
+                loss: str = "ovr",
+                acc_dtype=None,
+                l1: float = 0,
+                l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    full batch gradient descent, data-parallel: the rows are split in one
+    contiguous shard per worker. Every step, the coordinator (this process)
+    broadcasts w, b, each worker computes the gradient and cost sums of
+    its shard, and the coordinator adds them up and updates w, b.
+
+    Args
+        workers: number of local worker processes (pipes, X and Y in shared
+                 memory), or list of (host, port) of socket workers
+                 (python3 distributed.py worker [host:]port), which get
+                 their shard over the connection. Socket workers need
+                 DSLR_AUTHKEY, the same as the workers'.
+        others: same as logreg_train.GD_optimizer()
+
+    Return
+        tuple(w, b, costs)
+        costs: cost list of every 100 steps
+    """
+
+    from logreg_train import sgd_update, penalty, soft_threshold, converged
+
+    w = np.array(w)
+    k, n = w.shape
+    m = len(X)
+    acc_dtype = np.dtype(acc_dtype or w.dtype)
+
+    # step message [command, w, b]: w and b are views of it.
+    theta = np.zeros(1 + k * n + k, dtype=w.dtype)
+    theta[1:1 + k * n] = w.ravel()
+    theta[1 + k * n:] = b
+    w, b = theta[1:1 + k * n].reshape(k, n), theta[1 + k * n:]
+
+    parts = np.empty(k * n + k + 1, dtype=acc_dtype)
+    total = np.empty_like(parts)
+    dw, db = total[:k * n].reshape(k, n), total[k * n:-1]
+
+    shms, conns, procs = [], [], []
+    try:
+        if isinstance(workers, int):
+            x_shm, _, x_spec = share_array(X)
+            shms.append(x_shm)
+            y_shm, _, y_spec = share_array(Y)
+            shms.append(y_shm)
+            conns, procs = start_local(workers)
+            bounds = np.linspace(0, m, len(conns) + 1).astype(int)
+            shards = [{"x_spec": x_spec, "y_spec": y_spec, "rows": (s, e)} for s, e in zip(bounds, bounds[1:])]
+        else:
+            authkey = get_authkey()
+            conns = [Client(tuple(address), authkey=authkey) for address in workers]
+            bounds = np.linspace(0, m, len(conns) + 1).astype(int)
+            shards = [{"x": np.asarray(X[s:e]), "y": np.asarray(Y[s:e])} for s, e in zip(bounds, bounds[1:])]
+
+        for conn, shard in zip(conns, shards):
+            conn.send(shard | {"shape": (k, n), "dtype": w.dtype.str, "acc_dtype": acc_dtype.str, "loss": loss})
+
+        update = sgd_update(lr)
+        costs = []
+        cost = None
+        prev_cost = np.inf
+
+        for i in range(epoch):
+
+            need_cost = (
+                i % 100 == 0 or i == epoch - 1 or tol or callback is not None or
+                (print_cost and i % print_cost == 0)
+            )
+
+            # broadcast w, b and reduce the shard sums
+            theta[0] = GRADIENT_COST if need_cost else GRADIENT
+            for conn in conns:
+                conn.send_bytes(theta)
+            total[:] = 0
+            for conn in conns:
+                conn.recv_bytes_into(parts)
+                total += parts
+            total /= m
+
+            if need_cost:
+                cost = float(total[-1]) + penalty(w, l1, l2)
+            if l2:
+                dw += l2 * w
+
+            update(w, b, dw, db)
+            if l1:
+                soft_threshold(w, lr * l1)
+
+            if i % 100 == 0:
+                costs.append(cost)
+
+            if print_cost and i % print_cost == 0:
+                print (f"The cost of iteration {i}: {cost}")
+
+            if callback is not None and callback("epoch", {"epoch": i, "cost": cost}):
+                break
+
+            if converged(prev_cost, cost, dw, db, tol):
+                break
+            prev_cost = cost
+
+        costs.append(cost)
+
+    finally:
+        theta[0] = STOP
+        for conn in conns:
+            try:
+                conn.send_bytes(theta)
+            except OSError:
+                pass
+            conn.close()
+        for proc in procs:
+            proc.join()
+        for shm in shms:
+            release(shm)
+
+    return w.copy(), b.copy(), costs
+
+
+def main():
+    """worker program: serve data-parallel GD (see parallel_gd()) to one
+coordinator at a time. DSLR_AUTHKEY must be set, to the coordinator's.
+An error of one connection is printed, and the worker keeps listening.
+
+usage: python3 distributed.py worker [host:]port   (default: localhost:6000)"""
+
+    try:
+        assert len(sys.argv) in (2, 3) and sys.argv[1] == "worker", \
+            "usage: python3 distributed.py worker [host:]port"
+
+        host, _, port = sys.argv[2].rpartition(":") if len(sys.argv) == 3 else ("", "", PORT)
+        address = (host or "localhost", int(port))
+        with Listener(address, authkey=get_authkey()) as listener:
+            print(f"worker listening on {address[0]}:{address[1]}", flush=True)
+            while True:
+                try:
+                    serve(listener.accept())
+                except Exception as e:
+                    print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+
+    except Exception as e:
+        print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
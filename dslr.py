@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+import sys
+import importlib
+
+# subcommand: (module, help). A module is imported only when its subcommand
+# runs, so that e.g. predict does not load pandas, matplotlib or tensorflow.
+COMMANDS = {
+    "describe": ("describe", "print statistics of the datasets"),
+    "histogram": ("histogram", "plot course score histograms by house"),
+    "scatter": ("scatter_plot", "plot course score pairs"),
+    "pair": ("pair_plot", "plot the pair plot of the selected features"),
+    "train": ("logreg_train", "[[--stream] train_file [ovr|softmax] | --update new_file [replay_file]] train the model"),
+    "select": ("feature_select", "[train_file] select the features automatically"),
+    "search": ("search", "[train_file] [n_random] cross-validated hyperparameter search"),
+    "distributed": ("distributed", "worker [host:]port serve data-parallel GD to a coordinator"),
+    "predict": ("logreg_predict", "[test_file | - | --serve socket_path] predict houses"),
+    "bench": ("bench", "[name] [args...] run a benchmark"),
+}
+
+
+def usage() -> str:
+    lines = ["usage: python3 dslr.py command [args...]", "", "commands:"]
+    lines += [f"  {name:10s} {text}" for name, (_, text) in COMMANDS.items()]
+    return "\n".join(lines)
+
+
+def run(command: str, args: list[str]) -> None:
+    """run main() of the module of command, with args as its command line."""
+
+    assert command in COMMANDS, f"unknown command: {command}\n{usage()}"
+
+    module = importlib.import_module(COMMANDS[command][0])
+    sys.argv = [module.__file__] + args
+    module.main()
+
+
+def main():
+    """dslr command line: one entry point for every script."""
+
+    try:
+        if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+            print(usage())
+            return
+        run(sys.argv[1], sys.argv[2:])
+
+    except Exception as e:
+        print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+
+import sys
+import numpy as np
+import pandas as pd
+from load_csv import load, HOGWARTS_SCHEMA
+from feature_store import encode_labels, one_hot
+from search import kfold, fit_stats, standardize, stacked_fit, stacked_score
+
+
+def correlation(x: np.ndarray) -> np.ndarray:
+    """Pearson correlation matrix (n_feature, n_feature) of the mean-filled columns of x."""
+
+    mean, std = fit_stats(x)
+    z = standardize(x, mean, std)
+    return z.T @ z / (len(z) - 1)
+
+
+def separability(x: np.ndarray, y: np.ndarray, n_category: int) -> np.ndarray:
+    """
+    one-vs-rest Fisher score of every feature for every category:
+    (mean_c - mean_rest)^2 / (var_c + var_rest), NaN ignored.
+
+    Return
+        score (n_category, n_feature)
+    """
+
+    valid = ~np.isnan(x)
+    x0 = np.where(valid, x, 0)
+    Y = one_hot(y, n_category).astype(np.float64)
+
+    # per category sums with one matmul each: (n_category, n_feature)
+    count = Y.T @ valid
+    total = Y.T @ x0
+    square = Y.T @ (x0 * x0)
+    rest_count = count.sum(axis=0) - count
+    rest_total = total.sum(axis=0) - total
+    rest_square = square.sum(axis=0) - square
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean, rest_mean = total / count, rest_total / rest_count
+        var = square / count - mean ** 2
+        rest_var = rest_square / rest_count - rest_mean ** 2
+        score = (mean - rest_mean) ** 2 / (var + rest_var)
+    return np.nan_to_num(score)
+
+
+def drop_redundant(corr: np.ndarray, score: np.ndarray, threshold: float = 0.9) -> np.ndarray:
+    """
+    index of the features kept, best score first: a feature is dropped if
+    its |correlation| with a better kept feature is over threshold.
+    """
+
+    kept = []
+    for i in np.argsort(-score, kind="stable"):
+        if not kept or np.max(np.abs(corr[i, kept])) <= threshold:
+            kept.append(i)
+    return np.array(kept, dtype=np.intp)
+
+
+def forward_select(x: np.ndarray, y: np.ndarray, n_category: int,
+                   k: int = 5, epoch: int = 100, lr: float = 1.0,
+                   tol: float = 0.5, seed: int = None) -> tuple[list[int], list[float], float]:
+    """
+    greedy forward selection: add the feature giving the best k-fold
+    accuracy until it is within tol (%) of the accuracy with every feature.
+    All candidates of a step are trained at once by stacked_fit(), each
+    masked to its own feature set, and warm-started from the model
+    selected at the previous step.
+
+    Return
+        tuple(selected, accuracy, full_accuracy)
+        selected: column index of x in selection order
+        accuracy: k-fold accuracy after each selection
+    """
+
+    n_feature = x.shape[1]
+    folds = []
+    for train_idx, val_idx in kfold(len(x), k, seed):
+        mean, std = fit_stats(x[train_idx])
+        folds.append((standardize(x[train_idx], mean, std), one_hot(y[train_idx], n_category),
+                      standardize(x[val_idx], mean, std), y[val_idx]))
+
+    # model of the previous step, per fold
+    W_prev = np.zeros((k, n_category, n_feature))
+    B_prev = np.zeros((k, n_category))
+
+    def cv_accuracy(masks, W_init, B_init):
+        accuracy = np.zeros(len(masks))
+        cost = np.zeros(len(masks))
+        models = []
+        for f, (x_train, y_train, x_val, y_val) in enumerate(folds):
+            W = np.repeat(W_init[f:f + 1], len(masks), axis=0)
+            B = np.repeat(B_init[f:f + 1], len(masks), axis=0)
+            stacked_fit(x_train, y_train, W, B, np.full(len(masks), lr), np.zeros(len(masks)), epoch, masks)
+            c, a = stacked_score(x_val, y_val, W, B)
+            cost += c
+            accuracy += a
+            models.append((W, B))
+        return accuracy / k, cost / k, models
+
+    full_accuracy = float(cv_accuracy(np.ones((1, n_feature)), W_prev, B_prev)[0][0])
+
+    selected, history = [], []
+    while len(selected) < n_feature:
+        candidates = [i for i in range(n_feature) if i not in selected]
+        masks = np.zeros((len(candidates), n_feature))
+        masks[:, selected] = 1
+        masks[np.arange(len(candidates)), candidates] = 1
+
+        accuracy, cost, models = cv_accuracy(masks, W_prev, B_prev)
+        # best accuracy, then lowest cost
+        best = np.lexsort((cost, -accuracy))[0]
+        for f, (W, B) in enumerate(models):
+            W_prev[f], B_prev[f] = W[best], B[best]
+        selected.append(candidates[best])
+        history.append(float(accuracy[best]))
+        if history[-1] >= full_accuracy - tol:
+            break
+
+    return selected, history, full_accuracy
+
+
+def select_features(data: pd.DataFrame, label: str = "Hogwarts House",
+                    exclude: list[str] = ("Index",),
+                    threshold: float = 0.9,
+                    max_candidates: int = 20,
+                    max_rows: int = 5_000,
+                    tol: float = 0.5,
+                    seed: int = 0) -> tuple[list[str], dict]:
+    """
+    smallest feature set keeping the accuracy of all features, from every
+    numeric column of data:
+    1. features correlated over threshold with a more separable one are dropped
+       (ex. Defense Against the Dark Arts = -Astronomy / 100).
+    2. the max_candidates most separable (one-vs-rest Fisher score) are kept.
+    3. greedy forward selection, on max_rows sampled rows at most.
+
+    Return
+        tuple(features, report)
+        report: per column scores, dropped columns and selection accuracies.
+    """
+
+    data = data[data[label].notna()]
+    columns = [c for c in data.select_dtypes("number").columns if c not in exclude]
+    x = data[columns].to_numpy(dtype=np.float64)
+    y, classes = encode_labels(data[label])
+
+    score = separability(x, y, len(classes)).max(axis=0)
+    kept = drop_redundant(correlation(x), score, threshold)
+    candidates = kept[:max_candidates]
+
+    if len(x) > max_rows:
+        rows = np.random.default_rng(seed).choice(len(x), max_rows, replace=False)
+        x, y = x[rows], y[rows]
+
+    order, accuracy, full_accuracy = forward_select(x[:, candidates], y, len(classes), tol=tol, seed=seed)
+    features = [columns[candidates[i]] for i in order]
+
+    report = {
+        "separability": dict(zip(columns, score.tolist())),
+        "redundant": [columns[i] for i in range(len(columns)) if i not in kept],
+        "candidates": [columns[i] for i in candidates],
+        "accuracy": dict(zip(features, accuracy)),
+        "full_accuracy": full_accuracy,
+    }
+    return features, report
+
+
+def main():
+    try:
+        assert len(sys.argv) == 2, "usage: python3 feature_select.py [file name for train]."
+
+        data = load(sys.argv[1], HOGWARTS_SCHEMA, cache=True)
+        assert data is not None, "data load failure."
+
+        features, report = select_features(data)
+
+        print("separability:")
+        for col, score in sorted(report["separability"].items(), key=lambda kv: -kv[1]):
+            print(f"  {col:30s} {score:8.3f}")
+        print("redundant:", ", ".join(report["redundant"]) or "-")
+        print(f"accuracy with every candidate: {report['full_accuracy']:.2f}%")
+        for col, accuracy in report["accuracy"].items():
+            print(f"  + {col:28s} {accuracy:6.2f}%")
+        print("selected features:", ", ".join(features))
+
+    except Exception as e:
+        print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from telemetry import span
+from pipeline import Preprocessor
+
+CHUNKSIZE = 65536
+
+
+def encode_labels(labels: pd.Series, classes: list[str] = None) -> tuple[np.ndarray, list[str]]:
+    """return class index (n_data,) and sorted class list.
+    the index is int8, or int16 for more than 127 classes.
+    classes: known sorted class list (ex. of a trained model), which every label must be in."""
+
+    if classes is not None:
+        unknown = set(labels.dropna().unique()) - set(classes)
+        assert not unknown, f"unknown classes: {', '.join(map(str, sorted(unknown)))}"
+    classes = np.sort(np.asarray(labels.dropna().unique() if classes is None else classes))
+    dtype = np.int8 if len(classes) <= np.iinfo(np.int8).max else np.int16
+    y = np.searchsorted(classes, np.asarray(labels)).astype(dtype)
+    return y, classes.tolist()
+
+
+def one_hot(y: np.ndarray, n_category: int, dtype=np.int8) -> np.ndarray:
+    """class index (n_data,) -> one hot (n_data, n_category)."""
+
+    Y = np.zeros((len(y), n_category), dtype=dtype)
+    Y[np.arange(len(y)), y] = 1
+    return Y
+
+
+def write_store(path: str, data: pd.DataFrame, features: list[str],
+                label: str = None,
+                pipeline: Preprocessor = None,
+                dtype=np.float32) -> dict:
+    """
+    write the standardized, imputed feature matrix (X.npy), the class
+    index vector (y.npy) and meta.json to directory path.
+    pipeline (imputation + Z score) is fitted on data with mean fill if not given.
+
+    Return
+        meta: features, classes, mean, std, fill, pipeline, dtype
+    """
+
+    if pipeline is None:
+        with span("standardize fit", rows=len(data)):
+            pipeline = Preprocessor(features).fit(data)
+    assert pipeline.features == list(features), "pipeline of other features."
+
+    os.makedirs(path, exist_ok=True)
+    X = np.lib.format.open_memmap(os.path.join(path, "X.npy"), mode="w+",
+                                  dtype=dtype, shape=(len(data), len(features)))
+    with span("fill + standardize", rows=len(data)):
+        pipeline.transform_frame(data, out=X)
+    X.flush()
+    del X
+
+    meta = store_meta(pipeline, dtype)
+
+    if label is not None:
+        y, meta["classes"] = encode_labels(data[label])
+        np.save(os.path.join(path, "y.npy"), y)
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    return meta
+
+
+def write_store_csv(path: str, src: str, pipeline: Preprocessor,
+                    label: str = None,
+                    dtype=np.float32,
+                    chunksize: int = CHUNKSIZE) -> dict:
+    """
+    write_store() of csv file src, read chunk by chunk: memory depends on
+    chunksize, not on the size of src. pipeline (not fitted) is fitted here.
+
+    1. src is parsed once: the raw pipeline columns are appended to a
+       float64 cache in path, the labels to a code cache, and the
+       imputation is fitted (fit_impute()) on the way.
+    2. the Z score is fitted on the cache (fit_scale()).
+    3. X.npy and y.npy are written from the cache, and the cache is removed.
+
+    Rows without a label are dropped.
+
+    Return
+        meta: same as write_store()
+    """
+
+    from load_csv import load_chunks
+
+    os.makedirs(path, exist_ok=True)
+    raw_path = os.path.join(path, "raw.bin")
+    code_path = os.path.join(path, "labels.bin")
+    n_col = len(pipeline.columns)
+    codes = {}
+
+    def parse(raw_file, code_file):
+        usecols = pipeline.columns + ([label] if label is not None else [])
+        for frame in load_chunks(src, chunksize, usecols=usecols):
+            if label is not None:
+                frame = frame[frame[label].notna()]
+                for value in frame[label].unique():
+                    codes.setdefault(value, len(codes))
+                code_file.write(frame[label].map(codes).to_numpy(dtype=np.int32).tobytes())
+            raw = frame[pipeline.columns].to_numpy(dtype=np.float64)
+            raw_file.write(raw.tobytes())
+            yield raw
+
+    try:
+        with span("parse + impute fit", path=src), \
+                open(raw_path, "wb") as raw_file, open(code_path, "wb") as code_file:
+            pipeline.fit_impute(parse(raw_file, code_file))
+
+        n = os.path.getsize(raw_path) // (8 * n_col)
+        assert n > 0, "no data."
+
+        # the cache is read and X written with plain file i/o, not memory
+        # maps, so that no page of them stays resident.
+        def chunks():
+            with open(raw_path, "rb") as f:
+                while len(chunk := np.fromfile(f, dtype=np.float64, count=chunksize * n_col)):
+                    yield chunk.reshape(-1, n_col)
+
+        with span("standardize fit", rows=n):
+            pipeline.fit_scale(chunks())
+
+        with span("fill + standardize", rows=n), open(os.path.join(path, "X.npy"), "wb") as f:
+            np.lib.format.write_array_header_1_0(f, {"descr": np.dtype(dtype).str, "fortran_order": False,
+                                                     "shape": (n, len(pipeline.features))})
+            for chunk in chunks():
+                f.write(pipeline.transform(chunk).astype(dtype).tobytes())
+
+        meta = store_meta(pipeline, dtype)
+
+        if label is not None:
+            # codes in order of appearance -> index in the sorted classes
+            classes = sorted(codes)
+            remap = np.array([classes.index(value) for value in codes])
+            y_dtype = np.int8 if len(classes) <= np.iinfo(np.int8).max else np.int16
+            with open(code_path, "rb") as src_file, open(os.path.join(path, "y.npy"), "wb") as f:
+                np.lib.format.write_array_header_1_0(f, {"descr": np.dtype(y_dtype).str,
+                                                         "fortran_order": False, "shape": (n,)})
+                while len(code := np.fromfile(src_file, dtype=np.int32, count=chunksize)):
+                    f.write(remap[code].astype(y_dtype).tobytes())
+            meta["classes"] = classes
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    finally:
+        for cache in (raw_path, code_path):
+            if os.path.exists(cache):
+                os.remove(cache)
+
+    return meta
+
+
+def store_meta(pipeline: Preprocessor, dtype) -> dict:
+    """meta.json of a store of the features of pipeline (fitted), without classes."""
+
+    return {
+        "features": list(pipeline.features),
+        "mean": np.asarray(pipeline.mean, dtype=np.float64).tolist(),
+        "std": np.asarray(pipeline.std, dtype=np.float64).tolist(),
+        "fill": np.asarray(pipeline.fill, dtype=np.float64).tolist(),
+        "pipeline": pipeline.config(),
+        "dtype": np.dtype(dtype).str,
+        "classes": None,
+    }
+
+
+def open_store(path: str) -> tuple[np.ndarray, np.ndarray, dict]:
+    """
+    memory-map a store made by write_store() (read only).
+
+    Return
+        tuple(X, y, meta). y is None if the store has no labels.
+    """
+
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    X = np.load(os.path.join(path, "X.npy"), mmap_mode="r")
+    y = None
+    if meta["classes"] is not None:
+        y = np.load(os.path.join(path, "y.npy"), mmap_mode="r")
+
+    return X, y, meta
@@ -4,7 +4,7 @@ import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from load_csv import load
+from load_csv import load, HOGWARTS_SCHEMA
 from logreg_train import data_fill
 
 
@@ -46,7 +46,7 @@ def answer(data: pd.DataFrame, lst: list[str]) -> None:
 
 def main():
     try:
-        data = load("datasets/dataset_train.csv")
+        data = load("datasets/dataset_train.csv", HOGWARTS_SCHEMA, cache=True)
         assert data is not None, "no data."
 
         # data.dropna(inplace=True)
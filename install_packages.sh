@@ -10,4 +10,4 @@ fi
 
 source ./bin/activate
 
-pip install numpy pandas matplotlib black seaborn tensorflow
\ No newline at end of file
+pip install numpy pandas matplotlib black seaborn tensorflow numba
\ No newline at end of file
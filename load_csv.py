@@ -1,8 +1,32 @@
 #!/usr/bin/python3
 
 import sys
-import pandas as pd
 import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import Iterator
+from telemetry import span
+
+CACHE_VERSION = 1
+
+COURSES = [
+    "Arithmancy", "Astronomy", "Herbology", "Defense Against the Dark Arts",
+    "Divination", "Muggle Studies", "Ancient Runes", "History of Magic",
+    "Transfiguration", "Potions", "Care of Magical Creatures", "Charms", "Flying"
+]
+
+HOGWARTS_SCHEMA = {
+    "dtype": {
+        "Index": "int64",
+        "Hogwarts House": "category",
+        "First Name": "object",
+        "Last Name": "object",
+        "Best Hand": "category",
+    } | dict.fromkeys(COURSES, "float32"),
+    "parse_dates": ["Birthday"],
+}
 
 
 def get_cur_dir() -> str:
@@ -15,10 +39,24 @@ get absolute path of current directory."""
     return cur_dir
 
 
-def load(path: str) -> pd.DataFrame:
-    """def load(path: str) -> pd.DataFrame:
+def get_path(path: str) -> str:
+    """def get_path(path: str) -> str:
+
+return absolute path. relative path is based on current directory."""
+
+    if not os.path.isabs(path):
+        path = get_cur_dir() + '/' + path
+    return path
 
-load data to pandas dataset"""
+
+def load(path: str, schema: dict = None, cache: bool = False) -> pd.DataFrame:
+    """def load(path: str, schema: dict = None, cache: bool = False) -> pd.DataFrame:
+
+load data to pandas dataset
+
+schema: {"dtype": {...}, "parse_dates": [...]} given to pd.read_csv. (ex. HOGWARTS_SCHEMA)
+cache: keep the parsed columns in a binary cache next to the csv, and
+       memory-map them on later loads instead of parsing the text again."""
 
     try:
         if not isinstance(path, str):
@@ -27,13 +65,15 @@ load data to pandas dataset"""
         if not path:
             raise ValueError("invalid input value")
 
-        if not os.path.isabs(path):
-            path = get_cur_dir() + '/' + path
+        path = get_path(path)
+        with span("load", path=path, cache=cache):
+            if cache:
+                return load_cached(path, schema)
 
-        data = pd.read_csv(path, header=0)
-        # print("Loading dataset of dimensions:", data.shape)
+            data = read_csv(path, schema)
+            # print("Loading dataset of dimensions:", data.shape)
 
-        return data
+            return data
 
     except AssertionError as e:
         print("AssertionError:", e, file=sys.stderr)
@@ -43,3 +83,162 @@ load data to pandas dataset"""
 
     except Exception as e:
         print("Error:", e, file=sys.stderr)
+
+
+def read_csv(path: str, schema: dict = None) -> pd.DataFrame:
+    """parse csv with the given schema."""
+
+    schema = schema or {}
+    return pd.read_csv(path, header=0,
+                       dtype=schema.get("dtype"),
+                       parse_dates=schema.get("parse_dates"))
+
+
+def get_cache_dir(path: str) -> str:
+    """cache directory of a csv file: <dir>/.<file name>.cache"""
+
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, f".{basename}.cache")
+
+
+def file_hash(path: str) -> str:
+    """sha1 of file content."""
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_cached(path: str, schema: dict = None) -> pd.DataFrame:
+    """
+    load csv through the binary cache. The cache is valid while the csv
+    has the same mtime and size, or the same sha1 when only mtime changed,
+    and was written with the same schema.
+    """
+
+    cache_dir = get_cache_dir(path)
+    meta_path = os.path.join(cache_dir, "meta.json")
+    stat = os.stat(path)
+    schema_key = repr(sorted((schema or {}).items()))
+
+    meta = None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if meta is not None and meta["version"] == CACHE_VERSION and meta["schema"] == schema_key:
+        if meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns:
+            return read_cache(cache_dir, meta)
+
+        if meta["size"] == stat.st_size and meta["sha1"] == file_hash(path):
+            # touched, but not changed.
+            meta["mtime_ns"] = stat.st_mtime_ns
+            write_json(meta_path, meta)
+            return read_cache(cache_dir, meta)
+
+    data = read_csv(path, schema)
+    meta = {
+        "version": CACHE_VERSION,
+        "schema": schema_key,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha1": file_hash(path),
+    }
+    try:
+        write_cache(cache_dir, meta, data)
+    except OSError as e:
+        print("Warning: cache not written:", e, file=sys.stderr)
+    return data
+
+
+def write_json(path: str, obj: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def write_cache(cache_dir: str, meta: dict, data: pd.DataFrame) -> None:
+    """
+    write every column as .npy files, so that they can be memory-mapped.
+    categorical and string columns are stored as integer codes and values.
+    """
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    columns = []
+    for i, col in enumerate(data.columns):
+        column = data[col]
+        entry = {"name": col, "file": f"{i}.npy"}
+
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            entry["kind"] = "category"
+            entry["categories"] = column.cat.categories.tolist()
+            np.save(os.path.join(cache_dir, entry["file"]), column.cat.codes.to_numpy())
+
+        elif column.dtype == object:
+            entry["kind"] = "string"
+            codes, uniques = pd.factorize(column)
+            entry["values"] = f"{i}.values.npy"
+            np.save(os.path.join(cache_dir, entry["file"]), codes.astype(np.int32))
+            np.save(os.path.join(cache_dir, entry["values"]), np.asarray(uniques, dtype=str))
+
+        else:
+            entry["kind"] = "array"
+            np.save(os.path.join(cache_dir, entry["file"]), column.to_numpy())
+
+        columns.append(entry)
+
+    meta["columns"] = columns
+    write_json(os.path.join(cache_dir, "meta.json"), meta)
+
+
+def read_cache(cache_dir: str, meta: dict) -> pd.DataFrame:
+    """
+    memory-map cached columns. arrays are mapped copy-on-write, so that the
+    dataset can be modified without touching the cache.
+    """
+
+    data = {}
+    for entry in meta["columns"]:
+        arr = np.load(os.path.join(cache_dir, entry["file"]), mmap_mode="c")
+
+        match entry["kind"]:
+            case "category":
+                data[entry["name"]] = pd.Categorical.from_codes(arr, entry["categories"])
+            case "string":
+                values = np.load(os.path.join(cache_dir, entry["values"])).astype(object)
+                column = np.take(values, arr) if len(values) else np.full(len(arr), np.nan, dtype=object)
+                column[arr < 0] = np.nan
+                data[entry["name"]] = column
+            case _:
+                data[entry["name"]] = arr
+
+    return pd.DataFrame(data, copy=False)
+
+
+def load_chunks(path, chunksize: int = 100_000, dtype: dict = None,
+                usecols: list[str] = None) -> Iterator[pd.DataFrame]:
+    """def load_chunks(path, chunksize: int = 100_000, dtype: dict = None, usecols: list[str] = None) -> Iterator[pd.DataFrame]:
+
+load data to pandas dataset chunk by chunk, so that only one chunk is in memory.
+path can also be an open file (ex. sys.stdin). usecols: columns to parse."""
+
+    if not isinstance(path, str) and not hasattr(path, "read"):
+        raise AssertionError("invalid input type")
+
+    if not isinstance(chunksize, int):
+        raise AssertionError("invalid input type")
+
+    if not path or chunksize <= 0:
+        raise ValueError("invalid input value")
+
+    if isinstance(path, str):
+        path = get_path(path)
+
+    with pd.read_csv(path, header=0, chunksize=chunksize, dtype=dtype, usecols=usecols) as reader:
+        yield from reader
@@ -1,40 +1,208 @@
 #!/usr/bin/python3
 
+import io
+import os
+import csv
 import sys
-import pickle
-import pandas as pd
-from load_csv import load, get_cur_dir
-from logreg_train import predict
+import stat
+import itertools
+import socketserver
+import numpy as np
+from typing import Iterator
+from telemetry import span, start_from_env
+from model_file import load_model, MODEL_NAME
+from pipeline import Preprocessor
 
+CHUNKSIZE = 100_000
 
-def main():
-    """Estimating price program for ft_linear_regression."""
+# this file only needs NumPy: the training code is not imported, and pandas
+# only parses the csv if it is installed.
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_chunks(src, columns: list[str], chunksize: int = CHUNKSIZE,
+                dtype=np.float64) -> Iterator[np.ndarray]:
+    """
+    Args
+        src: csv path (relative paths are based on the script directory,
+             as load_csv.get_path()) or open text file (ex. sys.stdin)
+        columns: names of the columns to read
+        chunksize: number of rows per chunk
+        dtype: float dtype of the chunks
+
+    Return
+        iterator of arrays (n_rows, len(columns)). empty fields are NaN.
+
+    The csv is parsed by pandas (load_csv.load_chunks()), or by a pure
+    Python reader if pandas is not installed.
+    """
 
+    if isinstance(src, str) and not os.path.isabs(src):
+        src = CUR_DIR + "/" + src
+
+    try:
+        from load_csv import load_chunks
+    except ImportError:
+        pass
+    else:
+        for chunk in load_chunks(src, chunksize, usecols=columns):
+            yield chunk[columns].to_numpy(dtype=dtype)
+        return
+
+    f = open(src, newline="") if isinstance(src, str) else src
     try:
-        assert len(sys.argv) == 2, "usage: python3 logreg_predict.py [test_file_name]."
+        reader = csv.reader(f)
+        header = next(reader, [])
+        missing = [col for col in columns if col not in header]
+        assert not missing, f"missing columns: {', '.join(missing)}."
+        idx = [header.index(col) for col in columns]
+
+        while rows := list(itertools.islice(reader, chunksize)):
+            x = [float(v) if v else np.nan for row in rows for v in map(row.__getitem__, idx)]
+            yield np.array(x, dtype=dtype).reshape(len(rows), len(columns))
+    finally:
+        if f is not src:
+            f.close()
+
+
+class Predictor:
+    """
+    House classifier loaded once from the model file, scoring data chunk by
+    chunk so that memory does not depend on the input size. Chunks are
+    parsed, imputed and scored in dtype (default: the one of the model file).
+    """
+
+    def __init__(self, model_path: str = None, dtype=None):
+        model_path = model_path or CUR_DIR + "/" + MODEL_NAME
+        model = load_model(model_path)
+        self.dtype = np.dtype(dtype or model["dtype"])
+
+        self.classes = np.array(model["classes"])
+        self.features = model["features"]
+
+        assert model["w"].shape == (len(self.classes), len(self.features)), "invalid weight shape."
+
+        self.w = model["w"].astype(self.dtype, copy=False)
+        self.b = model["b"].astype(self.dtype, copy=False)
+        self.pipeline = Preprocessor.from_model(model)
+
+    def predict_index(self, x: np.ndarray) -> np.ndarray:
+        """return predicted class index of every row (n_data,) of the raw pipeline columns x."""
+
+        # fill NaN and get Z score, in place.
+        x = self.pipeline.transform(x)
+
+        # sigmoid and softmax are monotonic: the best house has the largest logit.
+        return np.argmax(x @ self.w.T + self.b, axis=1)
+
+    def format_rows(self, pred: np.ndarray, start: int) -> str:
+        """'index,house' lines of a chunk, built without a Python loop per row."""
+
+        if len(pred) == 0:
+            return ""
+        index = np.arange(start, start + len(pred)).astype(str)
+        lines = np.char.add(np.char.add(index, ","), self.classes[pred])
+        return "\n".join(lines.tolist()) + "\n"
 
-        path = sys.argv[1]
-        data = load(path)
+    def predict_stream(self, src, dst, chunksize: int = CHUNKSIZE) -> int:
+        """
+        score csv src (path or open file) chunk by chunk and write
+        'Index,Hogwarts House' csv to the open file dst.
+        return number of rows.
+        """
+
+        dst.write("Index,Hogwarts House\n")
+        n = 0
+        chunks = read_chunks(src, self.pipeline.columns, chunksize, self.dtype)
+        while True:
+            with span("read"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return n
+            with span("predict", rows=len(chunk)):
+                pred = self.predict_index(chunk)
+            with span("write"):
+                dst.write(self.format_rows(pred, n))
+            n += len(chunk)
+
+
+class PredictHandler(socketserver.StreamRequestHandler):
+    """one request: a csv batch until the client shuts down writing. reply: predictions."""
+
+    def handle(self):
+        data = self.rfile.read()
+        out = io.StringIO()
+        try:
+            self.server.predictor.predict_stream(io.StringIO(data.decode()), out)
+        except Exception as e:
+            out = io.StringIO(f"{e.__class__.__name__}: {e}\n")
+        self.wfile.write(out.getvalue().encode())
+
+
+def serve(socket_path: str, predictor: Predictor = None) -> None:
+    """
+    answer prediction requests on a unix socket until interrupted, so that
+    python, numpy and the model are loaded only once. See request().
+    A stale socket at socket_path is replaced; any other file is kept.
+    """
+
+    if os.path.lexists(socket_path):
+        assert stat.S_ISSOCK(os.lstat(socket_path).st_mode), f"{socket_path} exists and is not a socket."
+        os.unlink(socket_path)
+
+    with socketserver.ThreadingUnixStreamServer(socket_path, PredictHandler) as server:
+        server.predictor = predictor or Predictor()
+        print(f"serving predictions on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def request(socket_path: str, csv_text: str) -> str:
+    """send a csv batch to serve() and return its 'Index,Hogwarts House' csv."""
+
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall(csv_text.encode())
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while data := s.recv(1 << 16):
+            chunks.append(data)
+    return b"".join(chunks).decode()
+
+
+def main():
+    """Hogwarts house prediction program for dslr.
+
+usage: python3 logreg_predict.py [test_file_name]     -> houses.csv
+       python3 logreg_predict.py -                    stdin -> stdout
+       python3 logreg_predict.py --serve [socket_path]
+
+DSLR_TRACE=trace.jsonl writes a trace of the run (see telemetry.py)."""
+
+    try:
+        start_from_env()
+        assert len(sys.argv) in (2, 3), "usage: python3 logreg_predict.py [test_file_name | - | --serve socket_path]."
 
-        path = get_cur_dir() + "/.param.pkl"
-        with open(path, "rb") as f:
-            w, b, selected_feature, mean, std = pickle.load(f)
+        if sys.argv[1] == "--serve":
+            serve(sys.argv[2] if len(sys.argv) == 3 else CUR_DIR + "/.predict.sock")
+            return
 
-        answer_list = sorted(['Ravenclaw', 'Slytherin', 'Gryffindor', 'Hufflepuff'])
+        assert len(sys.argv) == 2, "usage: python3 logreg_predict.py [test_file_name | - | --serve socket_path]."
 
-        assert w.shape == (len(answer_list), len(selected_feature)), "invalid weight shape."
+        predictor = Predictor()
 
-        # get Z score
-        data.fillna(mean, inplace=True)
-        x_test_tmp = data[selected_feature]
-        x_test = ((x_test_tmp - mean) / std).to_numpy()
+        if sys.argv[1] == "-":
+            predictor.predict_stream(sys.stdin, sys.stdout)
+            return
 
-        y_pred = predict(w, b, x_test)
-        
-        with open(get_cur_dir() + "/houses.csv", "w") as f:
-            f.write("Index,Hogwarts House\n")
-            for idx, pred_idx in enumerate(y_pred.argmax(axis=1)):
-                f.write(f"{idx},{answer_list[pred_idx]}\n")
+        with open(CUR_DIR + "/houses.csv", "w") as f:
+            predictor.predict_stream(sys.argv[1], f)
 
     except Exception as e:
         print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
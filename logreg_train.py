@@ -1,14 +1,30 @@
 #!/usr/bin/python3
 
 import sys
+import functools
 import pandas as pd
 import numpy as np
-import copy
-import pickle
-from load_csv import load, get_cur_dir
+import telemetry
+from load_csv import load, load_chunks, get_cur_dir, HOGWARTS_SCHEMA
+from feature_store import write_store, write_store_csv, open_store, one_hot, encode_labels, CHUNKSIZE
+from pipeline import Preprocessor, HOGWARTS_DERIVED
+from model_file import save_model, load_model, MODEL_NAME
+from batch_loader import BatchLoader
+from shm import share_array, attach_shared, release
+from concurrent.futures import ProcessPoolExecutor
 
 EPS = 1e-7
 
+OPTIMIZERS = ["BGD", "SGD", "GD", "Momentum", "Nesterov", "Adam", "Newton", "LBFGS"]
+
+# ovr: one sigmoid (binary cost) per category. softmax: multinomial model.
+LOSSES = ["ovr", "softmax"]
+
+# rows per partial product when the gradient sums are accumulated in a
+# wider dtype than the data (see sum_product()).
+ACC_BLOCK = 4096
+
+
 def sigmoid(z: np.ndarray) -> np.ndarray:
     """sigmoid function."""
 
@@ -17,29 +33,20 @@ def sigmoid(z: np.ndarray) -> np.ndarray:
     return 1 / (np.exp(-z_clipped) + 1)
 
 
-# def softmax(z: np.ndarray) -> np.ndarray:
-#     """softmax function."""
-
-#     exp_z = np.exp(z - np.max(z))
-#     return exp_z / np.sum(exp_z, axis=0)
-
-
 def get_one_hot_value(x: np.ndarray) -> np.ndarray:
     """one hot value for categorical. Max value -> 1, and the others -> 0."""
 
-    max_idx = np.argmax(x, axis=1)
     res = np.zeros_like(x)
-    for i in range(len(max_idx)):
-        res[i, max_idx[i]] = 1
+    res[np.arange(len(x)), np.argmax(x, axis=1)] = 1
     return res
 
 
 def one_hot_encoding(x: pd.Series) -> np.ndarray:
-    """convert categorical variable to binary vector."""
+    """convert categorical variable to binary vector (int8).
+    encode_labels() gives the compact class index form."""
 
-    unique_val = x.unique()
-    unique_val.sort()
-    return (x.values.reshape(-1, 1) == unique_val).astype(int)
+    y, classes = encode_labels(x)
+    return one_hot(y, len(classes))
 
 
 def propagate(w: np.ndarray, b: np.ndarray,
@@ -49,7 +56,7 @@ def propagate(w: np.ndarray, b: np.ndarray,
         w: weights (n_category, n_feature)
         b: bias (n_category,)
         X: train data X (n_data, n_feature)
-        Y: train data Y (n_data, n_category)
+        Y: train data Y (n_data, n_category), or class index (n_data,)
 
     Return
         dw: gradient loss of weights
@@ -64,22 +71,190 @@ def propagate(w: np.ndarray, b: np.ndarray,
     A = sigmoid(X @ w.T + b)
 
     # Cost(loss) add epsilon for preventing errors
-    cost = - np.sum(Y * np.log(A + EPS) + (1 - Y) * np.log(1 - A + EPS)) / m
+    cost = logistic_cost(A, Y)
 
-    dw = (A - Y).T @ X / m
-    db = np.sum((A - Y).T, axis=1) / m
+    # A - Y
+    subtract_target(A, Y)
+    dw = A.T @ X / m
+    db = np.sum(A.T, axis=1) / m
 
     cost = np.squeeze(np.array(cost))
 
     return dw, db, cost
 
 
+def propagate_into(w: np.ndarray, b: np.ndarray,
+                   X: np.ndarray, Y: np.ndarray,
+                   Z: np.ndarray, dw: np.ndarray, db: np.ndarray,
+                   with_cost: bool = True,
+                   work: "Workspace" = None) -> float:
+    """
+    propagate() without allocations: results are written to preallocated
+    buffers.
+
+    Args
+        w, b, X, Y: same as propagate()
+        Z: work buffer (n_data, n_category). Holds A - Y on return.
+        dw: output gradient of weights (n_category, n_feature)
+        db: output gradient of bias (n_category,)
+        with_cost: compute the cost. It needs temporaries, so only ask for
+                   it when it is recorded.
+        work: Workspace of the batch size, for a class index Y. Without
+              it, the target of each row is indexed with temporaries.
+
+    the computation runs in the dtype of Z; the gradient and cost sums are
+    accumulated in the dtype of dw (ex. float64 for float32 data).
+
+    Return
+        cost: negative log-likelihood cost, or None if not with_cost
+    """
+
+    m = X.shape[0]
+
+    # A = sigmoid(X @ w.T + b), in place in Z
+    np.matmul(X, w.T, out=Z)
+    Z += b
+    np.clip(Z, -32, 32, out=Z)
+    np.negative(Z, out=Z)
+    np.exp(Z, out=Z)
+    Z += 1
+    np.reciprocal(Z, out=Z)
+
+    cost = logistic_cost(Z, Y, dw.dtype) if with_cost else None
+
+    # A - Y
+    subtract_target(Z, Y, work)
+    sum_product(Z, X, dw)
+    dw /= m
+    np.sum(Z, axis=0, dtype=db.dtype, out=db)
+    db /= m
+
+    return cost
+
+
+class Workspace:
+    """
+    preallocated buffers of propagate_into() and softmax_propagate_into()
+    for batches of up to n rows and k categories, made once per training
+    run so that a step allocates nothing.
+    """
+
+    def __init__(self, n: int, k: int, dtype=np.float64):
+        # flat index of the first logit of each row of a (n, k) buffer
+        self.offset = np.arange(n) * k
+        self.index = np.empty(n, dtype=np.intp)
+        self.target = np.empty(n, dtype=dtype)
+        self.row = np.empty(n, dtype=dtype)
+        self.ones = np.ones(k, dtype=dtype)
+
+
+def sum_product(Z: np.ndarray, X: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    out = Z.T @ X, the sum over rows of the gradient. If out is wider than
+    Z (float64 sums of float32 data), the products of ACC_BLOCK rows are
+    computed in the data dtype and summed in out, so that no full-size
+    float64 copy of X is made.
+    """
+
+    if out.dtype == np.result_type(Z, X):
+        return np.matmul(Z.T, X, out=out)
+
+    out[...] = 0
+    for start in range(0, len(X), ACC_BLOCK):
+        out += Z[start:start + ACC_BLOCK].T @ X[start:start + ACC_BLOCK]
+    return out
+
+
+def softmax_propagate_into(w: np.ndarray, b: np.ndarray,
+                           X: np.ndarray, Y: np.ndarray,
+                           Z: np.ndarray, dw: np.ndarray, db: np.ndarray,
+                           with_cost: bool = True,
+                           work: Workspace = None) -> float:
+    """
+    propagate_into() of the softmax model, with the cross-entropy fused
+    into the softmax by log-sum-exp: after shifting each row of logits by
+    its max, cost = mean(log(sum(exp(z))) - z_target). This takes one exp
+    per logit and one log per row, where the one-vs-rest cost takes two
+    logs per logit, and never takes the log of a rounded probability.
+
+    Z holds P - Y on return. dtypes and work as propagate_into().
+    """
+
+    m = X.shape[0]
+    if work is None:
+        work = Workspace(m, Z.shape[1], Z.dtype)
+
+    np.matmul(X, w.T, out=Z)
+    Z += b
+    Z -= row_max(Z, work.row[:m])[:, None]
+
+    if with_cost:
+        target = Z[np.arange(m), Y] if Y.ndim == 1 else np.sum(Z * Y, axis=1)
+
+    # P = exp(z) / sum(exp(z)), in place in Z
+    np.exp(Z, out=Z)
+    total = np.matmul(Z, work.ones, out=work.row[:m])
+    cost = float(np.mean(np.log(total) - target, dtype=dw.dtype)) if with_cost else None
+    Z /= total[:, None]
+
+    # P - Y
+    subtract_target(Z, Y, work)
+    sum_product(Z, X, dw)
+    dw /= m
+    np.sum(Z, axis=0, dtype=db.dtype, out=db)
+    db /= m
+
+    return cost
+
+
+def row_max(Z: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """max of each row (n_data,), in out if given. With few columns, a loop
+    over them is several times faster than np.max(Z, axis=1)."""
+
+    if out is None:
+        out = np.empty(len(Z), dtype=Z.dtype)
+    out[:] = Z[:, 0]
+    for c in range(1, Z.shape[1]):
+        np.maximum(out, Z[:, c], out=out)
+    return out
+
+
+def forward(logits: np.ndarray, Y: np.ndarray, loss: str = "ovr",
+            acc_dtype=None) -> tuple[np.ndarray, float]:
+    """
+    Return
+        tuple(A, cost) of logits (n_data, n_category): predicted probabilities
+        (sigmoid or softmax) and their cost, summed in acc_dtype (default:
+        dtype of logits). logits is overwritten.
+    """
+
+    if loss == "softmax":
+        logits -= row_max(logits)[:, None]
+        target = logits[np.arange(len(Y)), Y] if Y.ndim == 1 else np.sum(logits * Y, axis=1)
+        np.exp(logits, out=logits)
+        total = logits @ np.ones(logits.shape[1], dtype=logits.dtype)
+        cost = float(np.mean(np.log(total) - target, dtype=acc_dtype))
+        logits /= total[:, None]
+        return logits, cost
+
+    A = sigmoid(logits)
+    return A, logistic_cost(A, Y, acc_dtype)
+
+
 def GD_optimizer(w: np.ndarray, b: np.ndarray,
                  X: np.ndarray, Y: np.ndarray,
                  epoch: int = 1,
                  lr: float = 0.001,
-                 print_cost: int = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+                 print_cost: int = 0,
+                 tol: float = 0,
+                 callback=None,
+                 loss: str = "ovr",
+                 acc_dtype=None,
+                 l1: float = 0,
+                 l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
     """
+    full batch gradient descent.
+
     Args
         w: weights (n_category, n_feature)
         b: bias (n_category,)
@@ -88,21 +263,42 @@ def GD_optimizer(w: np.ndarray, b: np.ndarray,
         epoch: number of iterations
         lr: learning rate
         print_cost: printing the loss every given steps
-    
+        tol: stop when the gradient norm or the relative change of the cost
+             is under tol. 0 for running every epoch.
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training.
+        loss: one of LOSSES
+        acc_dtype: dtype of the gradient and cost sums, ex. np.float64 for
+                   float32 w. default: dtype of w
+        l1: L1 penalty on w, applied by a proximal step (soft threshold
+            of lr * l1) after every update: weights reach exact zeros.
+        l2: L2 penalty (l2 / 2 * |w|^2) on w. Both: elastic net.
+
     Return
         tuple(w, b, costs)
         costs: cost list of every 100 steps
     """
 
-    return BGD_optimizer(w, b, X, Y, epoch=epoch, batch=X.shape[0], lr=lr, print_cost=print_cost)
+    return BGD_optimizer(w, b, X, Y, epoch=epoch, batch=X.shape[0], lr=lr, print_cost=print_cost, tol=tol,
+                         callback=callback, loss=loss, acc_dtype=acc_dtype, l1=l1, l2=l2)
 
 
 def SGD_optimizer(w: np.ndarray, b: np.ndarray,
                   X: np.ndarray, Y: np.ndarray,
                   epoch: int = 1,
                   lr: float = 0.001,
-                  print_cost: int = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+                  print_cost: int = 0,
+                  tol: float = 0,
+                  shuffle: bool = True,
+                  seed: int = None,
+                  callback=None,
+                  loss: str = "ovr",
+                  acc_dtype=None,
+                  l1: float = 0,
+                  l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
     """
+    stochastic gradient descent.
+
     Args
         w: weights (n_category, n_feature)
         b: bias (n_category,)
@@ -111,13 +307,178 @@ def SGD_optimizer(w: np.ndarray, b: np.ndarray,
         epoch: number of iterations
         lr: learning rate
         print_cost: printing the loss every given steps
-    
+        tol: stop when the gradient norm or the relative change of the cost
+             of the full set is under tol. 0 for running every epoch.
+             (without numba: the ones of the last sample, see BGD_optimizer())
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training.
+        loss: one of LOSSES
+        acc_dtype: dtype of the gradient and cost sums, ex. np.float64 for
+                   float32 w. default: dtype of w
+        l1: L1 penalty on w, applied by a proximal step (soft threshold
+            of lr * l1) after every update: weights reach exact zeros.
+        l2: L2 penalty (l2 / 2 * |w|^2) on w. Both: elastic net.
+        shuffle: reshuffle the rows every epoch
+        seed: random seed of the shuffle
+
     Return
         tuple(w, b, costs)
         costs: cost list of every 100 steps
     """
 
-    return BGD_optimizer(w, b, X, Y, epoch=epoch, batch=1, lr=lr, print_cost=print_cost)
+    if get_sgd_kernel() is not None:
+        return fast_SGD_optimizer(w, b, X, Y, epoch, lr, print_cost, tol, shuffle, seed, callback,
+                                  loss, acc_dtype, l1, l2)
+
+    return BGD_optimizer(w, b, X, Y, epoch=epoch, batch=1, lr=lr, print_cost=print_cost, tol=tol,
+                         shuffle=shuffle, seed=seed, callback=callback, loss=loss, acc_dtype=acc_dtype,
+                         l1=l1, l2=l2)
+
+
+def sgd_kernel(w: np.ndarray, b: np.ndarray,
+               X: np.ndarray, Y: np.ndarray,
+               order: np.ndarray, lr: float,
+               softmax: bool = False,
+               l1: float = 0.0,
+               l2: float = 0.0) -> None:
+    """
+    one SGD epoch (batch=1) over rows in order, updating w, b in place.
+    The steps are the ones of run_epochs(): the gradient of the loss
+    (sigmoid per category, or softmax) plus l2 * w, then the soft
+    threshold of lr * l1.
+    """
+
+    n_category, n_feature = w.shape
+    a = np.empty(n_category)
+    for idx in order:
+        for c in range(n_category):
+            z = b[c]
+            for f in range(n_feature):
+                z += X[idx, f] * w[c, f]
+            a[c] = z
+
+        if softmax:
+            top = a.max()
+            total = 0.0
+            for c in range(n_category):
+                a[c] = np.exp(a[c] - top)
+                total += a[c]
+            for c in range(n_category):
+                a[c] /= total
+        else:
+            for c in range(n_category):
+                a[c] = 1.0 / (1.0 + np.exp(-min(max(a[c], -32.0), 32.0)))
+
+        for c in range(n_category):
+            g = a[c] - Y[idx, c]
+            for f in range(n_feature):
+                w[c, f] -= lr * (g * X[idx, f] + l2 * w[c, f])
+                if l1:
+                    w[c, f] = np.sign(w[c, f]) * max(abs(w[c, f]) - lr * l1, 0.0)
+            b[c] -= lr * g
+
+
+@functools.cache
+def get_sgd_kernel():
+    """compiled sgd_kernel, or None if numba is not installed. numba is imported on first use."""
+
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    return njit(cache=True)(sgd_kernel)
+
+
+def fast_SGD_optimizer(w: np.ndarray, b: np.ndarray,
+                       X: np.ndarray, Y: np.ndarray,
+                       epoch: int = 1,
+                       lr: float = 0.001,
+                       print_cost: int = 0,
+                       tol: float = 0,
+                       shuffle: bool = True,
+                       seed: int = None,
+                       callback=None,
+                       loss: str = "ovr",
+                       acc_dtype=None,
+                       l1: float = 0,
+                       l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    SGD_optimizer() with every per-sample update of an epoch done inside
+    the compiled sgd_kernel. Rows are visited through a permutation, so X
+    is never copied. The cost and the gradient that tol tests are the
+    ones of the full set (with the penalties), evaluated after the epochs
+    that record or test them, in blocks of ACC_BLOCK rows.
+    """
+
+    w = np.array(w)
+    b = np.array(b, dtype=w.dtype)
+    rng = np.random.default_rng(seed)
+
+    # the kernel reads one hot targets (n_data * n_category bytes).
+    Y_hot = one_hot(Y, w.shape[0]) if Y.ndim == 1 else Y
+    order = np.arange(len(X))
+    kernel = get_sgd_kernel()
+
+    costs = []
+    cost = None
+    prev_cost = np.inf
+
+    # work buffers of the full set cost, allocated once
+    block = max(1, min(len(X), ACC_BLOCK))
+    Z = np.empty((block, w.shape[0]), dtype=w.dtype)
+    work = Workspace(block, w.shape[0], w.dtype)
+    dw = np.empty_like(w, dtype=acc_dtype)
+    db = np.empty_like(b, dtype=acc_dtype)
+    part_w = np.empty_like(dw)
+    part_b = np.empty_like(db)
+    step = softmax_propagate_into if loss == "softmax" else propagate_into
+
+    for i in range(epoch):
+        if shuffle:
+            order = rng.permutation(len(X))
+
+        kernel(w, b, X, Y_hot, order, lr, loss == "softmax", l1, l2)
+
+        need_cost = (
+            i % 100 == 0 or i == epoch - 1 or tol or callback is not None or
+            (print_cost and i % print_cost == 0)
+        )
+
+        if need_cost:
+            # cost and gradient of the full set: sums over blocks of rows
+            dw[...] = 0
+            db[...] = 0
+            total = 0.0
+            for start in range(0, len(X), block):
+                x, y = X[start:start + block], Y[start:start + block]
+                total += step(w, b, x, y, Z[:len(x)], part_w, part_b, work=work) * len(x)
+                part_w *= len(x)
+                dw += part_w
+                part_b *= len(x)
+                db += part_b
+            dw /= len(X)
+            db /= len(X)
+            if l2:
+                np.multiply(w, l2, out=part_w)
+                dw += part_w
+            cost = total / len(X) + penalty(w, l1, l2)
+
+        if i % 100 == 0:
+            costs.append(cost)
+
+        if print_cost and i % print_cost == 0:
+            print (f"The cost of iteration {i}: {cost}")
+
+        if callback is not None and callback("epoch", {"epoch": i, "cost": cost}):
+            break
+
+        if converged(prev_cost, cost, dw, db, tol):
+            break
+        prev_cost = cost
+
+    costs.append(cost)
+
+    return w, b, costs
 
 
 def BGD_optimizer(w: np.ndarray, b: np.ndarray,
@@ -125,8 +486,18 @@ def BGD_optimizer(w: np.ndarray, b: np.ndarray,
                   epoch: int = 1,
                   batch: int = 32,
                   lr: float = 0.001,
-                  print_cost: int = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+                  print_cost: int = 0,
+                  tol: float = 0,
+                  shuffle: bool = True,
+                  seed: int = None,
+                  callback=None,
+                  loss: str = "ovr",
+                  acc_dtype=None,
+                  l1: float = 0,
+                  l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
     """
+    mini-batch gradient descent.
+
     Args
         w: weights (n_category, n_feature)
         b: bias (n_category,)
@@ -136,30 +507,289 @@ def BGD_optimizer(w: np.ndarray, b: np.ndarray,
         batch: data size for updating w, b
         lr: learning rate
         print_cost: printing the loss every given steps
-    
+        tol: stop when the gradient norm or the relative change of the cost
+             is under tol. 0 for running every epoch.
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training.
+        loss: one of LOSSES
+        acc_dtype: dtype of the gradient and cost sums, ex. np.float64 for
+                   float32 w. default: dtype of w
+        l1: L1 penalty on w, applied by a proximal step (soft threshold
+            of lr * l1) after every update: weights reach exact zeros.
+        l2: L2 penalty (l2 / 2 * |w|^2) on w. Both: elastic net.
+        shuffle: reshuffle the rows every epoch
+        seed: random seed of the shuffle
+
     Return
         tuple(w, b, costs)
         costs: cost list of every 100 steps
     """
 
-    w = copy.deepcopy(w)
-    b = copy.deepcopy(b)
+    return run_epochs(w, b, X, Y, sgd_update(lr), epoch, batch, print_cost, tol, shuffle, seed, callback,
+                      loss, acc_dtype, l1, l2, lr)
+
+
+def Momentum_optimizer(w: np.ndarray, b: np.ndarray,
+                       X: np.ndarray, Y: np.ndarray,
+                       epoch: int = 1,
+                       batch: int = 32,
+                       lr: float = 0.001,
+                       print_cost: int = 0,
+                       tol: float = 0,
+                       shuffle: bool = True,
+                       seed: int = None,
+                       momentum: float = 0.9,
+                       nesterov: bool = False,
+                       callback=None,
+                       loss: str = "ovr",
+                       acc_dtype=None,
+                       l1: float = 0,
+                       l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    mini-batch gradient descent with (Nesterov) momentum.
+
+    Args
+        w: weights (n_category, n_feature)
+        b: bias (n_category,)
+        X: train data X (n_data, n_feature)
+        Y: train data Y (n_data, n_category)
+        epoch: number of iterations
+        batch: data size for updating w, b
+        lr: learning rate
+        print_cost: printing the loss every given steps
+        tol: stop when the gradient norm or the relative change of the cost
+             is under tol. 0 for running every epoch.
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training.
+        loss: one of LOSSES
+        acc_dtype: dtype of the gradient and cost sums, ex. np.float64 for
+                   float32 w. default: dtype of w
+        l1: L1 penalty on w, applied by a proximal step (soft threshold
+            of lr * l1) after every update: weights reach exact zeros.
+        l2: L2 penalty (l2 / 2 * |w|^2) on w. Both: elastic net.
+        shuffle: reshuffle the rows every epoch
+        seed: random seed of the shuffle
+
+    Return
+        tuple(w, b, costs)
+        costs: cost list of every 100 steps
+    """
+
+    return run_epochs(w, b, X, Y, momentum_update(lr, momentum, nesterov), epoch, batch, print_cost, tol,
+                      shuffle, seed, callback, loss, acc_dtype, l1, l2, lr)
+
+
+def Adam_optimizer(w: np.ndarray, b: np.ndarray,
+                   X: np.ndarray, Y: np.ndarray,
+                   epoch: int = 1,
+                   batch: int = 32,
+                   lr: float = 0.001,
+                   print_cost: int = 0,
+                   tol: float = 0,
+                   shuffle: bool = True,
+                   seed: int = None,
+                   beta1: float = 0.9,
+                   beta2: float = 0.999,
+                   callback=None,
+                   loss: str = "ovr",
+                   acc_dtype=None,
+                   l1: float = 0,
+                   l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    mini-batch Adam (Kingma & Ba 2015).
+
+    Args
+        w: weights (n_category, n_feature)
+        b: bias (n_category,)
+        X: train data X (n_data, n_feature)
+        Y: train data Y (n_data, n_category)
+        epoch: number of iterations
+        batch: data size for updating w, b
+        lr: learning rate
+        print_cost: printing the loss every given steps
+        tol: stop when the gradient norm or the relative change of the cost
+             is under tol. 0 for running every epoch.
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training.
+        loss: one of LOSSES
+        acc_dtype: dtype of the gradient and cost sums, ex. np.float64 for
+                   float32 w. default: dtype of w
+        l1: L1 penalty on w, applied by a proximal step (soft threshold
+            of lr * l1) after every update: weights reach exact zeros.
+        l2: L2 penalty (l2 / 2 * |w|^2) on w. Both: elastic net.
+        shuffle: reshuffle the rows every epoch
+        seed: random seed of the shuffle
+
+    Return
+        tuple(w, b, costs)
+        costs: cost list of every 100 steps
+    """
+
+    return run_epochs(w, b, X, Y, adam_update(lr, beta1, beta2), epoch, batch, print_cost, tol,
+                      shuffle, seed, callback, loss, acc_dtype, l1, l2, lr)
+
+
+def sgd_update(lr: float):
+    """update(w, b, dw, db) of plain gradient descent. (in place)"""
+
+    scratch = {}
+
+    def update(w, b, dw, db):
+        if scratch.get("w") is None or scratch["w"].shape != w.shape:
+            scratch["w"], scratch["b"] = np.empty_like(w), np.empty_like(b)
+
+        # w -= lr * dw, without a temporary array
+        np.multiply(dw, lr, out=scratch["w"])
+        np.multiply(db, lr, out=scratch["b"])
+        w -= scratch["w"]
+        b -= scratch["b"]
+
+    return update
+
+
+def momentum_update(lr: float, momentum: float = 0.9, nesterov: bool = False):
+    """update(w, b, dw, db) of gradient descent with (Nesterov) momentum. (in place)"""
+
+    v = {}
+
+    def update(w, b, dw, db):
+        for key, param, grad in (("w", w, dw), ("b", b, db)):
+            prev = v.get(key, np.zeros_like(param))
+            v[key] = momentum * prev - lr * grad
+            if nesterov:
+                # param is kept at the look-ahead point (Bengio et al. 2013).
+                param += (1 + momentum) * v[key] - momentum * prev
+            else:
+                param += v[key]
+
+    return update
+
+
+def adam_update(lr: float, beta1: float = 0.9, beta2: float = 0.999, eps: float = 1e-8):
+    """update(w, b, dw, db) of Adam. (in place)"""
+
+    state = {"t": 0}
+
+    def update(w, b, dw, db):
+        state["t"] += 1
+        t = state["t"]
+        for key, param, grad in (("w", w, dw), ("b", b, db)):
+            m = state[key + "m"] = beta1 * state.get(key + "m", 0) + (1 - beta1) * grad
+            v = state[key + "v"] = beta2 * state.get(key + "v", 0) + (1 - beta2) * grad ** 2
+            param -= lr * (m / (1 - beta1 ** t)) / (np.sqrt(v / (1 - beta2 ** t)) + eps)
+
+    return update
+
+
+def penalty(w: np.ndarray, l1: float = 0, l2: float = 0) -> float:
+    """l1 * |w|_1 + l2 / 2 * |w|^2, the cost of the penalties."""
+
+    cost = 0.0
+    if l1:
+        cost += l1 * float(np.sum(np.abs(w)))
+    if l2:
+        cost += l2 / 2 * float(np.sum(np.square(w)))
+    return cost
+
+
+def soft_threshold(w: np.ndarray, t: float) -> None:
+    """proximal step of t * |w|_1: shrink every weight toward 0 by t, stopping at 0. (in place)"""
+
+    shrunk = np.abs(w)
+    shrunk -= t
+    np.maximum(shrunk, 0, out=shrunk)
+    np.copysign(shrunk, w, out=w)
+
+
+def converged(prev_cost: float, cost: float, dw: np.ndarray, db: np.ndarray, tol: float) -> bool:
+    """True if the gradient norm or the relative change of the cost is under tol."""
+
+    if not tol:
+        return False
+
+    grad_norm = np.sqrt(np.sum(dw ** 2) + np.sum(db ** 2))
+    if grad_norm < tol:
+        return True
+    return np.isfinite(prev_cost) and abs(prev_cost - cost) <= tol * max(abs(prev_cost), EPS)
+
+
+def run_epochs(w: np.ndarray, b: np.ndarray,
+               X: np.ndarray, Y: np.ndarray,
+               update,
+               epoch: int = 1,
+               batch: int = 32,
+               print_cost: int = 0,
+               tol: float = 0,
+               shuffle: bool | str = True,
+               seed: int = None,
+               callback=None,
+               loss: str = "ovr",
+               acc_dtype=None,
+               l1: float = 0,
+               l2: float = 0,
+               lr: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    mini-batch loop shared by the first order optimizers.
+    update(w, b, dw, db) updates w, b in place. Batches come from a
+    BatchLoader, reshuffled every epoch by a permutation seeded with seed
+    (shuffle="block": block order and rows within blocks only).
+    While tracing, the time of propagate and update is summed per epoch.
+    loss selects the propagate kernel (propagate_into, softmax_propagate_into).
+    The steps run in the dtype of w, batches of X are used as they are.
+    l2 is added to the gradient, and l1 is applied as a soft threshold of
+    lr * l1 after every update (proximal gradient; lr is only used there). The recorded cost
+    includes the penalties.
+    """
+
+    w = np.array(w)
+    b = np.array(b, dtype=w.dtype)
 
     costs = []
+    cost = None
+    prev_cost = np.inf
 
-    lim = len(X) // batch + (1 if len(X) % batch else 0)
+    loader = BatchLoader(X, Y, batch, shuffle=shuffle, seed=seed)
+    lim = len(loader)
+
+    # work buffers, allocated once
+    Z = np.empty((min(batch, len(X)), w.shape[0]), dtype=w.dtype)
+    dw = np.empty_like(w, dtype=acc_dtype)
+    db = np.empty_like(b, dtype=acc_dtype)
+
+    work = Workspace(len(Z), w.shape[0], w.dtype)
+
+    step = softmax_propagate_into if loss == "softmax" else propagate_into
+    tracer = telemetry.TRACER
+    if tracer is not None:
+        step = tracer.timed("propagate", step)
+        update = tracer.timed("update", update)
 
     for i in range(epoch):
 
+        # the cost of the last batch is needed only when it is recorded.
+        need_cost = (
+            i % 100 == 0 or i == epoch - 1 or tol or callback is not None or
+            (print_cost and i % print_cost == 0)
+        )
+
         # batch loop
-        for j in range(lim):
-        
+        for j, (x_batch, y_batch) in enumerate(loader):
+
             # calculate dw, db, cost
-            dw, db, cost = propagate(w, b, X[batch * j: batch * (j + 1)], Y[batch * j: batch * (j + 1)])
+            c = step(w, b, x_batch, y_batch, Z[:len(x_batch)], dw, db,
+                     with_cost=need_cost and j == lim - 1, work=work)
+            if c is not None:
+                cost = c + penalty(w, l1, l2)
+            if l2:
+                dw += l2 * w
 
             # update w, b
-            w = w - lr * dw
-            b = b - lr * db
+            update(w, b, dw, db)
+            if l1:
+                soft_threshold(w, lr * l1)
+
+        if tracer is not None:
+            tracer.flush()
 
         if i % 100 == 0:
             costs.append(cost)
@@ -167,30 +797,317 @@ def BGD_optimizer(w: np.ndarray, b: np.ndarray,
         if print_cost and i % print_cost == 0:
             print (f"The cost of iteration {i}: {cost}")
 
-        # # check converged
-        # if (np.isclose(dw, np.zeros_like(dw), rtol=1e-6).all() or
-        #     np.isclose(db, np.zeros_like(db), rtol=1e-6).all()):
-        #     break
+        if callback is not None and callback("epoch", {"epoch": i, "cost": cost}):
+            break
+
+        # check converged
+        if converged(prev_cost, cost, dw, db, tol):
+            break
+        prev_cost = cost
 
     costs.append(cost)
 
     return w, b, costs
 
 
-def predict(w: np.ndarray, b: np.ndarray, X: np.ndarray) -> np.ndarray:
+def Newton_optimizer(w: np.ndarray, b: np.ndarray,
+                     X: np.ndarray, Y: np.ndarray,
+                     epoch: int = 100,
+                     print_cost: int = 0,
+                     tol: float = 1e-6,
+                     ridge: float = 1e-6,
+                     callback=None,
+                     loss: str = "ovr",
+                     acc_dtype=None,
+                     l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    Newton's method (IRLS). With one-vs-rest, each category has its own
+    (n_feature + 1)^2 Hessian, which is cheap because there are few
+    features; softmax couples the categories in one softmax_hessian().
+    The step is halved until the cost decreases. ridge keeps the Hessian
+    invertible on separable data (and softmax, which is over-parameterized).
+
+    Args
+        w: weights (n_category, n_feature)
+        b: bias (n_category,)
+        X: train data X (n_data, n_feature)
+        Y: train data Y (n_data, n_category)
+        epoch: maximum number of iterations
+        print_cost: printing the loss every given steps
+        tol: stop when the gradient norm or the relative change of the cost
+             is under tol. 0 for running every epoch.
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training.
+        loss: one of LOSSES
+        acc_dtype: dtype of the gradient and cost sums, ex. np.float64 for
+                   float32 w. default: dtype of w
+        l2: L2 penalty (l2 / 2 * |w|^2) on w. L1 needs a first order optimizer.
+
+    Return
+        tuple(w, b, costs)
+        costs: cost list of every 100 steps
     """
+
+    # theta = [w | b]: (n_category, n_feature + 1), in the dtype of w
+    Xb, theta = with_bias(X, w, b)
+    m = X.shape[0]
+    acc_dtype = acc_dtype or theta.dtype
+    # ridge on every parameter, l2 on the weights only (not the bias)
+    diag = ridge + l2 * (np.arange(Xb.shape[1]) < X.shape[1])
+
+    costs = []
+    prev_cost = np.inf
+    for i in range(epoch):
+        # spans of every iteration: the stages of the default training path
+        with telemetry.span("propagate", epoch=i):
+            A, cost = forward(Xb @ theta.T, Y, loss, acc_dtype)
+            cost += penalty(theta[:, :-1], l2=l2)
+            if loss == "softmax":
+                H = softmax_hessian(Xb, A, 0, acc_dtype)
+                H += np.diag(np.tile(diag, theta.shape[0]))
+            else:
+                S = A * (1 - A)
+
+            subtract_target(A, Y)
+            grad = sum_product(A, Xb, np.empty(theta.shape, dtype=acc_dtype)) / m
+            grad[:, :-1] += l2 * theta[:, :-1]
+
+        with telemetry.span("update", epoch=i):
+            if loss == "softmax":
+                step = np.linalg.solve(H, grad.reshape(-1)).reshape(theta.shape)
+            else:
+                step = np.empty(theta.shape, dtype=acc_dtype)
+                H = np.empty((Xb.shape[1], Xb.shape[1]), dtype=acc_dtype)
+                for c in range(theta.shape[0]):
+                    sum_product(Xb * S[:, c:c + 1], Xb, H)
+                    H /= m
+                    H += np.diag(diag)
+                    step[c] = np.linalg.solve(H, grad[c])
+
+            theta, cost = line_search(theta, step.astype(theta.dtype), Xb, Y, cost, loss=loss,
+                                      acc_dtype=acc_dtype, l2=l2)
+
+        if i % 100 == 0:
+            costs.append(cost)
+
+        if print_cost and i % print_cost == 0:
+            print (f"The cost of iteration {i}: {cost}")
+
+        if callback is not None and callback("epoch", {"epoch": i, "cost": cost}):
+            break
+
+        if converged(prev_cost, cost, grad, np.zeros(0), tol):
+            break
+        prev_cost = cost
+
+    costs.append(cost)
+
+    return theta[:, :-1].copy(), theta[:, -1].copy(), costs
+
+
+def softmax_hessian(Xb: np.ndarray, P: np.ndarray, ridge: float = 0, acc_dtype=None) -> np.ndarray:
+    """
+    Hessian of the softmax cost over theta = [w | b] flattened by category:
+    block (c, d) = Xb.T @ diag(P_c * (c == d) - P_c * P_d) @ Xb / m.
+
+    Return
+        H (n_category * n_col, n_category * n_col), plus ridge * I,
+        summed in acc_dtype (default: dtype of Xb)
+    """
+
+    m, n_col = Xb.shape
+    n_category = P.shape[1]
+    H = np.empty((n_category, n_col, n_category, n_col), dtype=acc_dtype or Xb.dtype)
+    block = np.empty((n_col, n_col), dtype=H.dtype)
+    for c in range(n_category):
+        for d in range(c, n_category):
+            s = P[:, c] * ((c == d) - P[:, d])
+            H[c, :, d] = H[d, :, c] = sum_product(Xb * s[:, None], Xb, block) / m
+
+    H = H.reshape(n_category * n_col, n_category * n_col)
+    H += ridge * np.eye(len(H))
+    return H
+
+
+def LBFGS_optimizer(w: np.ndarray, b: np.ndarray,
+                    X: np.ndarray, Y: np.ndarray,
+                    epoch: int = 500,
+                    print_cost: int = 0,
+                    tol: float = 1e-6,
+                    history: int = 10,
+                    callback=None,
+                    loss: str = "ovr",
+                    acc_dtype=None,
+                    l2: float = 0) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    L-BFGS with a backtracking line search. history: number of
+    (step, gradient change) pairs kept.
+
     Args
         w: weights (n_category, n_feature)
         b: bias (n_category,)
         X: train data X (n_data, n_feature)
+        Y: train data Y (n_data, n_category)
+        epoch: maximum number of iterations
+        print_cost: printing the loss every given steps
+        tol: stop when the gradient norm or the relative change of the cost
+             is under tol. 0 for running every epoch.
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training.
+        loss: one of LOSSES
+        acc_dtype: dtype of the gradient and cost sums, ex. np.float64 for
+                   float32 w. default: dtype of w
+        l2: L2 penalty (l2 / 2 * |w|^2) on w. L1 needs a first order optimizer.
 
     Return
-        Y_pred: predict value (n_data, n_category)
+        tuple(w, b, costs)
+        costs: cost list of every 100 steps
     """
 
+    Xb, theta = with_bias(X, w, b)
     m = X.shape[0]
+    acc_dtype = acc_dtype or theta.dtype
 
-    A = sigmoid(X @ w.T + b)
+    def cost_grad(theta):
+        A, cost = forward(Xb @ theta.T, Y, loss, acc_dtype)
+        subtract_target(A, Y)
+        grad = sum_product(A, Xb, np.empty(theta.shape, dtype=acc_dtype)) / m
+        grad[:, :-1] += l2 * theta[:, :-1]
+        return cost + penalty(theta[:, :-1], l2=l2), grad
+
+    cost, grad = cost_grad(theta)
+    s_list, y_list = [], []
+
+    costs = []
+    for i in range(epoch):
+        # spans of every iteration, as Newton_optimizer()
+        with telemetry.span("update", epoch=i):
+            # two-loop recursion: direction = H^-1 grad
+            q = grad.copy()
+            alphas = []
+            for s, y in zip(reversed(s_list), reversed(y_list)):
+                alpha = np.sum(s * q) / np.sum(y * s)
+                q -= alpha * y
+                alphas.append(alpha)
+            if s_list:
+                q *= np.sum(s_list[-1] * y_list[-1]) / np.sum(y_list[-1] ** 2)
+            for (s, y), alpha in zip(zip(s_list, y_list), reversed(alphas)):
+                q += (alpha - np.sum(y * q) / np.sum(y * s)) * s
+
+            prev_cost = cost
+            new_theta, cost = line_search(theta, q.astype(theta.dtype), Xb, Y, cost, loss=loss,
+                                          acc_dtype=acc_dtype, l2=l2)
+
+        with telemetry.span("propagate", epoch=i):
+            cost, new_grad = cost_grad(new_theta)
+
+        s, y = new_theta - theta, new_grad - grad
+        if np.sum(s * y) > EPS:
+            s_list.append(s)
+            y_list.append(y)
+            if len(s_list) > history:
+                s_list.pop(0)
+                y_list.pop(0)
+        theta, grad = new_theta, new_grad
+
+        if i % 100 == 0:
+            costs.append(cost)
+
+        if print_cost and i % print_cost == 0:
+            print (f"The cost of iteration {i}: {cost}")
+
+        if callback is not None and callback("epoch", {"epoch": i, "cost": cost}):
+            break
+
+        if converged(prev_cost, cost, grad, np.zeros(0), tol):
+            break
+
+    costs.append(cost)
+
+    return theta[:, :-1].copy(), theta[:, -1].copy(), costs
+
+
+def with_bias(X: np.ndarray, w: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return
+        tuple(Xb, theta): Xb = [X | 1] (n_data, n_feature + 1) and
+        theta = [w | b] (n_category, n_feature + 1), both in the dtype of w.
+    """
+
+    Xb = np.empty((X.shape[0], X.shape[1] + 1), dtype=w.dtype)
+    Xb[:, :-1] = X
+    Xb[:, -1] = 1
+    theta = np.hstack([w, np.reshape(b, (-1, 1))]).astype(w.dtype)
+    return Xb, theta
+
+
+def subtract_target(A: np.ndarray, Y: np.ndarray, work: Workspace = None) -> None:
+    """A -= Y in place. Y is one hot (n_data, n_category) or class index (n_data,).
+    work: Workspace of at least n_data rows, to index the targets of a
+    C contiguous A without temporaries."""
+
+    if Y.ndim != 1:
+        A -= Y
+    elif work is None or not A.flags.c_contiguous:
+        A[np.arange(len(Y)), Y] -= 1
+    else:
+        m = len(Y)
+        index = np.add(work.offset[:m], Y, out=work.index[:m])
+        flat = A.reshape(-1)
+        # the indices are valid: "clip" spares the bounds check buffer of "raise".
+        target = np.take(flat, index, out=work.target[:m], mode="clip")
+        target -= 1
+        np.put(flat, index, target, mode="clip")
+
+
+def logistic_cost(A: np.ndarray, Y: np.ndarray, acc_dtype=None) -> float:
+    """negative log-likelihood cost for logistic regression.
+    Y is one hot (n_data, n_category) or class index (n_data,).
+    acc_dtype: dtype of the sum (default: dtype of A)."""
+
+    if Y.ndim == 1:
+        # every category is negative, except the target one.
+        target = A[np.arange(len(Y)), Y]
+        total = (np.sum(np.log(1 - A + EPS), dtype=acc_dtype) +
+                 np.sum(np.log(target + EPS) - np.log(1 - target + EPS), dtype=acc_dtype))
+        return float(- total / A.shape[0])
+
+    return float(- np.sum(Y * np.log(A + EPS) + (1 - Y) * np.log(1 - A + EPS), dtype=acc_dtype) / A.shape[0])
+
+
+def line_search(theta: np.ndarray, step: np.ndarray,
+                Xb: np.ndarray, Y: np.ndarray, cost: float,
+                max_halving: int = 30,
+                loss: str = "ovr",
+                acc_dtype=None,
+                l2: float = 0) -> tuple[np.ndarray, float]:
+    """return theta - t * step and its cost (with the l2 penalty of the weights),
+    halving t from 1 until the cost decreases."""
+
+    t = 1.0
+    for _ in range(max_halving):
+        new_theta = theta - t * step
+        _, new_cost = forward(Xb @ new_theta.T, Y, loss, acc_dtype)
+        new_cost += penalty(new_theta[:, :-1], l2=l2)
+        if new_cost <= cost:
+            return new_theta, new_cost
+        t /= 2
+    return theta, cost
+
+
+def predict(w: np.ndarray, b: np.ndarray, X: np.ndarray, dtype=None) -> np.ndarray:
+    """
+    Args
+        w: weights (n_category, n_feature)
+        b: bias (n_category,)
+        X: train data X (n_data, n_feature)
+        dtype: float dtype of the computation. default: the one of X @ w
+
+    Return
+        Y_pred: predict value (n_data, n_category)
+    """
+
+    A = sigmoid(linear(w, b, X, dtype))
 
     if w.shape[0] == 1:
         Y_pred = (A > 0.5).astype(int)
@@ -202,57 +1119,330 @@ def predict(w: np.ndarray, b: np.ndarray, X: np.ndarray) -> np.ndarray:
     return Y_pred.astype(int)
 
 
+def predict_index(w: np.ndarray, b: np.ndarray, X: np.ndarray, dtype=None) -> np.ndarray:
+    """
+    Args
+        w: weights (n_category, n_feature)
+        b: bias (n_category,)
+        X: train data X (n_data, n_feature)
+        dtype: float dtype of the computation. default: the one of X @ w
+
+    Return
+        predicted class index (n_data,). sigmoid is monotonic, so this is
+        the argmax of the logits.
+    """
+
+    return np.argmax(linear(w, b, X, dtype), axis=1)
+
+
+def linear(w: np.ndarray, b: np.ndarray, X: np.ndarray, dtype=None) -> np.ndarray:
+    """X @ w.T + b (n_data, n_category), computed in dtype if given."""
+
+    if dtype is not None:
+        X, w, b = (np.asarray(a, dtype=dtype) for a in (X, w, b))
+    return X @ w.T + b
+
+
 def model(x_train: np.ndarray, y_train: np.ndarray,
           w_init: np.ndarray = None, b_init: np.ndarray = None,
           epoch: int = 1,
           batch: int = 32,
           lr: int = 0.001,
           print_cost: int = 100,
-          optimizer: str = "BGD") -> tuple[np.ndarray, np.ndarray, list[float]]:
+          optimizer: str = "BGD",
+          tol: float = 0,
+          shuffle: bool | str = True,
+          seed: int = None,
+          workers: int | list = 1,
+          n_category: int = None,
+          callback=None,
+          loss: str = "ovr",
+          dtype=np.float64,
+          acc_dtype=None,
+          l1: float = 0,
+          l2: float = 0,
+          data_parallel: bool = False) -> tuple[np.ndarray, np.ndarray, list[float]]:
     """
     Args
         x_train: train data for input (n_data, n_feature)
-        y_train: train data for output (n_data, n_category)
+        y_train: train data for output (n_data, n_category), or class index
+                 (n_data,) when n_category is given
         w_init: init w (n_category, n_feature)
         b_init: inti bias (n_category,)
-        epoch: number of iterations
+        epoch: number of iterations (maximum number for Newton and LBFGS)
         batch: data size for updating w, b
-        lr: learning rate
+        lr: learning rate (not used by Newton and LBFGS)
         print_cost: printing the cost every n steps. 0 or None for not printing.
-    
+        optimizer: one of OPTIMIZERS
+        tol: stop when the gradient norm or the relative change of the cost
+             is under tol. 0 for running every epoch.
+        callback: called as callback("epoch", {"epoch", "cost"}) after every
+                  epoch. Returning True stops the training. Defaults to the
+                  active telemetry tracer. Not called from worker processes.
+        shuffle: reshuffle the rows every epoch (mini-batch optimizers).
+                 "block": shuffle the blocks and the rows within each
+                 block only (see BatchLoader), for x_train on disk.
+        seed: random seed of the shuffle
+        workers: > 1 for fitting each category (one-vs-rest) in its own
+                 process, each stopping at its own convergence. With
+                 data_parallel, the number of row shards, or a list of
+                 (host, port) of socket workers.
+        n_category: number of categories, when y_train is a class index.
+        loss: one of LOSSES. "ovr" fits one sigmoid per category, "softmax"
+              one multinomial model (one gradient for all categories).
+        dtype: float dtype of w, b and of the training steps. x_train is
+               not converted as a whole: with np.float32, a float32
+               x_train (ex. the feature store) is used without any copy.
+        acc_dtype: dtype of the gradient and cost sums. np.float64 with
+                   dtype np.float32 keeps float64 sums. default: dtype
+        l1: L1 penalty on w (proximal step; first order optimizers only).
+            Weights of useless features become exactly 0 (see prune()).
+        l2: L2 penalty on w. l1 and l2 together: elastic net.
+        data_parallel: GD with the rows split across the workers, which
+                       compute the gradient of their shard every step
+                       (see distributed.parallel_gd()). Any loss.
+
     Return
         tuple(w, b, costs)
         costs: cost list of every 100 steps
     """
 
     assert len(y_train.shape) in (1, 2), "invalid y value."
-    assert optimizer in ["BGD", "SGD", "GD"], "invalid optimizer."
+    assert optimizer in OPTIMIZERS, "invalid optimizer."
+    assert loss in LOSSES, "invalid loss."
+    assert l1 >= 0 and l2 >= 0, "invalid penalty."
+    assert not l1 or optimizer not in ("Newton", "LBFGS"), f"{optimizer} does not support l1."
 
-    if len(y_train.shape) == 1:
+    if len(y_train.shape) == 1 and n_category is None:
         y_train = y_train.reshape(-1, 1)
 
     n_feature = x_train.shape[1]
-    n_category = y_train.shape[1]
+    if n_category is None:
+        n_category = y_train.shape[1]
 
     # w shape is (n_category, n_feature), and b shape is (n_category,)
     if w_init is None:
         w_init = np.zeros((n_category, n_feature))
     if b_init is None:
         b_init = np.zeros(n_category)
+    w_init = np.asarray(w_init, dtype=dtype)
+    b_init = np.asarray(b_init, dtype=dtype)
+
+    assert loss == "ovr" or n_category > 1, "softmax needs 2 categories or more."
+
+    if callback is None:
+        callback = telemetry.TRACER
+
+    assert data_parallel or isinstance(workers, int), "a list of socket workers needs data_parallel."
+
+    if data_parallel:
+        from distributed import parallel_gd
+
+        assert optimizer == "GD", "data parallel training is GD only."
+        with telemetry.span("model", optimizer="parallel GD", loss=loss, dtype=np.dtype(dtype).name,
+                            rows=len(x_train), features=n_feature,
+                            workers=workers if isinstance(workers, int) else len(workers)):
+            return parallel_gd(w_init, b_init, x_train, y_train, workers, epoch, lr, print_cost, tol,
+                               callback=callback, loss=loss, acc_dtype=acc_dtype, l1=l1, l2=l2)
+
+    if workers > 1 and n_category > 1:
+        assert loss == "ovr", "softmax categories can not be fitted in separate processes."
+        kwargs = dict(epoch=epoch, batch=batch, lr=lr, print_cost=print_cost,
+                      optimizer=optimizer, tol=tol, shuffle=shuffle, seed=seed,
+                      dtype=dtype, acc_dtype=acc_dtype, l1=l1, l2=l2)
+        return ovr_model(x_train, y_train, w_init, b_init, workers, kwargs)
+
+    with telemetry.span("model", optimizer=optimizer, loss=loss, dtype=np.dtype(dtype).name,
+                        rows=len(x_train), features=n_feature):
+        match optimizer:
+            case "BGD":
+                w, b, costs = BGD_optimizer(w_init, b_init, x_train, y_train, epoch, batch, lr, print_cost, tol,
+                                            shuffle, seed, callback=callback, loss=loss, acc_dtype=acc_dtype,
+                                            l1=l1, l2=l2)
+            case "SGD":
+                w, b, costs = SGD_optimizer(w_init, b_init, x_train, y_train, epoch, lr, print_cost, tol,
+                                            shuffle, seed, callback=callback, loss=loss, acc_dtype=acc_dtype,
+                                            l1=l1, l2=l2)
+            case "GD":
+                w, b, costs = GD_optimizer(w_init, b_init, x_train, y_train, epoch, lr, print_cost, tol,
+                                           callback=callback, loss=loss, acc_dtype=acc_dtype,
+                                           l1=l1, l2=l2)
+            case "Momentum" | "Nesterov":
+                w, b, costs = Momentum_optimizer(w_init, b_init, x_train, y_train, epoch, batch, lr, print_cost,
+                                                 tol, shuffle, seed, nesterov=(optimizer == "Nesterov"),
+                                                 callback=callback, loss=loss, acc_dtype=acc_dtype,
+                                                 l1=l1, l2=l2)
+            case "Adam":
+                w, b, costs = Adam_optimizer(w_init, b_init, x_train, y_train, epoch, batch, lr, print_cost, tol,
+                                             shuffle, seed, callback=callback, loss=loss, acc_dtype=acc_dtype,
+                                             l1=l1, l2=l2)
+            case "Newton":
+                w, b, costs = Newton_optimizer(w_init, b_init, x_train, y_train, epoch, print_cost, tol,
+                                               callback=callback, loss=loss, acc_dtype=acc_dtype,
+                                               l2=l2)
+            case "LBFGS":
+                w, b, costs = LBFGS_optimizer(w_init, b_init, x_train, y_train, epoch, print_cost, tol,
+                                              callback=callback, loss=loss, acc_dtype=acc_dtype,
+                                              l2=l2)
+
+    return w, b, costs
+
+
+def fit_category(x_spec: tuple, y_spec: tuple, c: int,
+                 w_init: np.ndarray, b_init: np.ndarray,
+                 kwargs: dict) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """train category c of shared X, Y alone. (runs in a worker)"""
 
-    match optimizer:
-        case "BGD":
-            w, b, costs = BGD_optimizer(w_init, b_init, x_train, y_train, epoch, batch, lr, print_cost)
-        case "SGD":
-            w, b, costs = SGD_optimizer(w_init, b_init, x_train, y_train, epoch, lr, print_cost)
-        case "GD":
-            w, b, costs = GD_optimizer(w_init, b_init, x_train, y_train, epoch, lr, print_cost)
+    x_shm, X = attach_shared(x_spec)
+    y_shm, Y = attach_shared(y_spec)
+    try:
+        y = Y[:, c:c + 1] if Y.ndim == 2 else (Y == c).astype(np.int8).reshape(-1, 1)
+        return model(X, y, w_init[c:c + 1], b_init[c:c + 1], **kwargs)
+    finally:
+        del X, Y
+        x_shm.close()
+        y_shm.close()
+
+
+def ovr_model(x_train: np.ndarray, y_train: np.ndarray,
+              w_init: np.ndarray, b_init: np.ndarray,
+              workers: int, kwargs: dict) -> tuple[np.ndarray, np.ndarray, list[float]]:
+    """
+    one-vs-rest training: the sigmoid cost of each category only depends
+    on its own row of w and b, so every category is fitted in its own
+    process from the same shared memory X and Y.
+
+    Return
+        tuple(w, b, costs)
+        costs: sum of the category costs. A category that stopped early
+               counts with its last cost.
+    """
+
+    n_category = len(w_init)
+    x_shm, _, x_spec = share_array(x_train)
+    y_shm, _, y_spec = share_array(y_train)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, n_category)) as pool:
+            futures = [
+                pool.submit(fit_category, x_spec, y_spec, c, w_init, b_init, kwargs)
+                for c in range(n_category)
+            ]
+            results = [f.result() for f in futures]
+    finally:
+        release(x_shm)
+        release(y_shm)
+
+    w = np.vstack([r[0] for r in results])
+    b = np.concatenate([r[1] for r in results])
+
+    n_cost = max(len(r[2]) for r in results)
+    costs = [
+        sum(float(r[2][min(i, len(r[2]) - 1)]) for r in results)
+        for i in range(n_cost)
+    ]
 
     return w, b, costs
 
 
-def get_feature_data(data: pd.DataFrame) -> tuple[pd.DataFrame, list[str]]:
-    """return x(features), y(answers)."""
+def prune(w: np.ndarray, pipeline: Preprocessor) -> tuple[np.ndarray, Preprocessor, list[str]]:
+    """
+    drop the features whose weight is 0 for every category (ex. after l1
+    training): they need not be read, imputed or multiplied.
+
+    Return
+        tuple(w, pipeline, pruned) of the used features. pruned: dropped names.
+    """
+
+    keep = np.any(w != 0, axis=0)
+    if keep.all():
+        return w, pipeline, []
+    pruned = [col for col, used in zip(pipeline.features, keep) if not used]
+    features = [col for col, used in zip(pipeline.features, keep) if used]
+    return w[:, keep], pipeline.select(features), pruned
+
+
+def save(path: str, w: np.ndarray, b: np.ndarray, pipeline: Preprocessor,
+         classes: list[str], **meta) -> int:
+    """save_model() of a model and its pipeline, without its unused (all zero) feature columns."""
+
+    w, pipeline, pruned = prune(np.asarray(w), pipeline)
+    if pruned:
+        meta["pruned"] = pruned
+    return save_model(path, w, b, classes=classes, **meta, **pipeline.model_args())
+
+
+def restandardize(w: np.ndarray, b: np.ndarray,
+                  mean: np.ndarray, std: np.ndarray,
+                  new_mean: np.ndarray, new_std: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    return w, b giving the same logits on data standardized with new_mean,
+    new_std as w, b on data standardized with mean, std.
+
+    x = new_std * x_new + new_mean, so
+    w @ (x - mean) / std + b = (w * new_std / std) @ x_new + b + w @ ((new_mean - mean) / std)
+    """
+
+    w = np.asarray(w, dtype=np.float64)
+    new_w = w * (np.asarray(new_std) / np.asarray(std))
+    new_b = np.asarray(b, dtype=np.float64) + w @ ((np.asarray(new_mean) - np.asarray(mean)) / np.asarray(std))
+    return new_w, new_b
+
+
+def incremental_model(params: dict, data: pd.DataFrame,
+                      replay: pd.DataFrame = None,
+                      label: str = "Hogwarts House",
+                      **kwargs) -> tuple[np.ndarray, np.ndarray, Preprocessor, int]:
+    """
+    warm-start training of a saved model (load_model()) on new rows.
+
+    the model pipeline is updated with the running statistics of data
+    (Preprocessor.update()), the saved w, b are re-expressed for its new
+    mean/std (same predictions), and a few epochs run over data and the
+    replay rows only (ex. a sample of the old data).
+
+    Args
+        params: loaded model, with meta["n_rows"] rows seen
+        data: new rows
+        replay: old rows trained again with the new ones, or None
+        kwargs: model() arguments. default: 5 Adam epochs, batch 32, lr 0.001,
+                with the loss of the saved model
+
+    Return
+        tuple(w, b, pipeline, n_rows)
+    """
+
+    assert "n_rows" in params["meta"], "the model has no row count: train it again."
+
+    classes = params["classes"]
+    n_rows = params["meta"]["n_rows"]
+
+    old = Preprocessor.from_model(params)
+    pipeline = old.update(data, n_rows)
+    w, b = restandardize(params["w"], params["b"], old.mean, old.std, pipeline.mean, pipeline.std)
+
+    train = data if replay is None else pd.concat([data, replay], ignore_index=True)
+    train = train[train[label].notna()]
+    assert len(train), "no labeled rows to train."
+    x = pipeline.transform_frame(train)
+    y, _ = encode_labels(train[label], classes)
+
+    kwargs = dict(dict(epoch=5, batch=32, lr=0.001, optimizer="Adam", print_cost=0,
+                       loss=params["meta"].get("loss", "ovr")), **kwargs)
+    w, b, _ = model(x, y, w, b, n_category=len(classes), **kwargs)
+
+    return w, b, pipeline, n_rows + len(data)
+
+
+def get_feature_data(data: pd.DataFrame, auto: bool = True) -> tuple[pd.DataFrame, list[str]]:
+    """return x(features), y(answers).
+    auto: select the features with feature_select.select_features(), instead
+          of the hand-picked lists below (chosen from the plots)."""
+
+    if auto:
+        from feature_select import select_features
+
+        selected_feature, _ = select_features(data)
+        return data[selected_feature], selected_feature
 
     # Astronomy and Defense Against the Dark Arts -> correlated.
     exclude_list = ["Defense Against the Dark Arts", "Arithmancy", "Care of Magical Creatures", "Potions"]
@@ -289,8 +1479,11 @@ def get_feature_data(data: pd.DataFrame) -> tuple[pd.DataFrame, list[str]]:
 
 
 def evaluate(w: np.ndarray, b: np.ndarray, x_test: np.ndarray, y_test: np.ndarray) -> float:
-    """return accuracy of prediction."""
-    
+    """return accuracy of prediction. y_test: one hot, or class index (n_data,)."""
+
+    if y_test.ndim == 1 and w.shape[0] > 1:
+        return np.mean(predict_index(w, b, x_test) == y_test) * 100
+
     y_pred = predict(w, b, x_test)
     
     assert y_pred.shape == y_test.shape, "invalid input. different shape"
@@ -301,52 +1494,130 @@ def evaluate(w: np.ndarray, b: np.ndarray, x_test: np.ndarray, y_test: np.ndarra
 
 
 def data_fill(data: pd.DataFrame) -> None:
-    data["Defense Against the Dark Arts"].fillna(- data["Astronomy"] / 100, inplace=True)
+    """fill NaN of every numeric column in place, as the model pipeline does (mean, derived columns)."""
+
+    with telemetry.span("fill", rows=len(data)):
+        columns = data.select_dtypes("number").columns.tolist()
+        pipeline = Preprocessor(columns, derived=HOGWARTS_DERIVED)
+        pipeline.fit_impute(pipeline.frame_chunks(data))
+        data[columns] = pipeline.impute(data[columns].to_numpy(dtype=np.float64))
+
+
+def update(path: str, replay_path: str = None, replay_frac: float = 0.1, seed: int = 0) -> None:
+    """
+    warm-start the saved model on the rows of csv path (see incremental_model()),
+    replaying a replay_frac sample of csv replay_path if given.
+    """
+
+    model_path = get_cur_dir() + "/" + MODEL_NAME
+    params = load_model(model_path)
+
+    data = load(path, HOGWARTS_SCHEMA, cache=True)
+    assert data is not None, "data load failure."
 
-    data.fillna(data.mean(numeric_only=True), inplace=True)
+    replay = None
+    if replay_path is not None:
+        old = load(replay_path, HOGWARTS_SCHEMA, cache=True)
+        assert old is not None, "data load failure."
+        replay = old.sample(frac=replay_frac, random_state=seed)
+
+    w, b, pipeline, n_rows = incremental_model(params, data, replay, seed=seed)
+    with telemetry.span("write model"):
+        save(model_path, w, b, pipeline, params["classes"], n_rows=n_rows, loss=params["meta"].get("loss", "ovr"))
+    print(f"Model updated with {len(data)} rows ({n_rows} rows seen) and saved to {model_path}")
+
+
+def stream_train(path: str, loss: str = "ovr", chunksize: int = CHUNKSIZE,
+                 epoch: int = 20, batch: int = 256, lr: float = 0.1, seed: int = 0) -> None:
+    """
+    out-of-core training on csv path, which is never loaded as a whole:
+    the csv is parsed chunk by chunk into the feature store (fitting the
+    pipeline on the way, see write_store_csv()), and mini-batch gradient
+    descent streams block-shuffled batches from the memory-mapped store.
+    Memory depends on chunksize, not on the size of path.
+    Features are the saved model's, or selected on the first chunk.
+    """
+
+    assert loss in LOSSES, f"invalid loss: {loss}"
+
+    model_path = get_cur_dir() + "/" + MODEL_NAME
+    try:
+        selected_feature = load_model(model_path)["features"]
+    except (OSError, ValueError, AssertionError):
+        _, selected_feature = get_feature_data(next(load_chunks(path, chunksize)))
+
+    pipeline = Preprocessor(selected_feature, derived=HOGWARTS_DERIVED)
+    store = get_cur_dir() + "/.features"
+    write_store_csv(store, path, pipeline, label="Hogwarts House", chunksize=chunksize)
+    x_train, y_train, meta = open_store(store)
+
+    w, b, _ = model(x_train, y_train, epoch=epoch, batch=batch, lr=lr, print_cost=0, optimizer="BGD",
+                    shuffle="block", seed=seed, n_category=len(meta["classes"]), loss=loss)
+    with telemetry.span("write model"):
+        save(model_path, w, b, pipeline, meta["classes"], n_rows=len(x_train), loss=loss)
+    print(f"Model trained on {len(x_train)} streamed rows and saved to {model_path}")
 
 
 def main():
+    """train program. DSLR_TRACE=trace.jsonl writes a trace of the run (see telemetry.py).
+
+usage: python3 logreg_train.py [train_file] [ovr | softmax]   (default: ovr)
+       python3 logreg_train.py --update [new_file] [replay_file]   warm-start the saved model
+       python3 logreg_train.py --stream [train_file] [ovr | softmax]   out-of-core training"""
+
     try:
-        assert len(sys.argv) == 2, "usage: python3 logreg_train.py [file name for train]."
+        telemetry.start_from_env()
+
+        if len(sys.argv) in (3, 4) and sys.argv[1] == "--update":
+            update(*sys.argv[2:])
+            return
+
+        if len(sys.argv) in (3, 4) and sys.argv[1] == "--stream":
+            stream_train(*sys.argv[2:])
+            return
+
+        assert len(sys.argv) in (2, 3), \
+            ("usage: python3 logreg_train.py [file name for train [ovr | softmax] | "
+             "--update new_file [replay_file] | --stream train_file [ovr | softmax]].")
+
+        loss = sys.argv[2] if len(sys.argv) == 3 else "ovr"
+        assert loss in LOSSES, f"invalid loss: {loss}"
 
         path = sys.argv[1]
-        data: pd.DataFrame = load(path)
-        data: pd.DataFrame = load("datasets/dataset_train.csv")
+        data: pd.DataFrame = load(path, HOGWARTS_SCHEMA, cache=True)
+        data: pd.DataFrame = load("datasets/dataset_train.csv", HOGWARTS_SCHEMA, cache=True)
 
         assert data is not None, "data load failure."
 
         selected_feature = None
 
-        path = get_cur_dir() + "/.param.pkl"
+        path = get_cur_dir() + "/" + MODEL_NAME
         try:
-            with open(path, "rb") as f:
-                w, b, selected_feature, mean, std = pickle.load(f)
-        except: None
+            selected_feature = load_model(path)["features"]
+        except (OSError, ValueError, AssertionError):
+            pass
 
         sample_data = data
 
         if selected_feature is None:
-            selected_df, selected_feature = get_feature_data(sample_data)
-        else:
-            selected_df = data[selected_feature]
-
-        # fill NaN to mean value.
-        x = selected_df.fillna(selected_df.mean(numeric_only=True))
-
-        mean = x.mean(numeric_only=True)
-        std = x.std(numeric_only=True)
-
-        # standardize input (using Z score)
-        x_train = ((x - mean) / std).to_numpy()
-        y_train = one_hot_encoding(sample_data["Hogwarts House"])
-
-        with open(path, "wb") as f:
-            w, b, _ = model(x_train, y_train, epoch=10000, lr=0.005, print_cost=0, optimizer="GD")
-            # w, b, _ = model(x_train, y_train, epoch=2000, batch=50, lr=0.005, print_cost=0, optimizer="BGD")
-            # w, b, _ = model(x_train, y_train, epoch=40, lr=0.005, print_cost=0, optimizer="SGD")
-            pickle.dump([w, b, selected_feature, mean, std], f)
-            print(f"Param(w, b, selected_feature, mean, std) saved to {path}")
+            _, selected_feature = get_feature_data(sample_data)
+
+        # fill NaN (mean, or from a correlated column), standardize input
+        # (using Z score) and write it to a memory-mapped store.
+        with telemetry.span("standardize fit", rows=len(sample_data)):
+            pipeline = Preprocessor(selected_feature, derived=HOGWARTS_DERIVED).fit(sample_data)
+        store = get_cur_dir() + "/.features"
+        meta = write_store(store, sample_data, selected_feature, label="Hogwarts House", pipeline=pipeline)
+        x_train, y_train, meta = open_store(store)
+
+        w, b, _ = model(x_train, y_train, epoch=100, print_cost=0, optimizer="Newton", tol=1e-6,
+                        n_category=len(meta["classes"]), loss=loss)
+        # w, b, _ = model(x_train, y_train, epoch=10000, lr=0.005, print_cost=0, optimizer="GD")
+        # w, b, _ = model(x_train, y_train, epoch=2000, batch=50, lr=0.005, print_cost=0, optimizer="BGD")
+        # w, b, _ = model(x_train, y_train, epoch=40, lr=0.005, print_cost=0, optimizer="SGD")
+        with telemetry.span("write model"):
+            save(path, w, b, pipeline, meta["classes"], n_rows=len(sample_data), loss=loss)
+        print(f"Model(w, b, selected_feature, pipeline, classes) saved to {path}")
 
     except Exception as e:
         print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
@@ -4,16 +4,16 @@ import sys
 import numpy as np
 import pandas as pd
 import time
-from load_csv import load
+from load_csv import load, HOGWARTS_SCHEMA
+from bench import summarize
 from logreg_train import get_feature_data, one_hot_encoding, model, evaluate, data_fill
-from tensorflow import keras
 
 
 def main():
 
     try:
 
-        data: pd.DataFrame = load("datasets/dataset_train.csv")
+        data: pd.DataFrame = load("datasets/dataset_train.csv", HOGWARTS_SCHEMA, cache=True)
 
         assert data is not None, "data load failure."
 
@@ -30,9 +30,11 @@ def main():
         data_fill(data)
 
         for i in range(10):
-            data_sample = data.sample(frac=1)
+            # seeded split and training, so that runs can be compared.
+            data_sample = data.sample(frac=1, random_state=i)
 
-            selected_df, selected_feature = get_feature_data(data_sample)
+            # fixed features, so that the splits only compare the optimizers.
+            selected_df, selected_feature = get_feature_data(data_sample, auto=False)
 
             # fill NaN to mean value.
             x = selected_df.fillna(selected_df.mean())
@@ -57,6 +59,8 @@ def main():
             l = []
             l_k = []
 
+            # tensorflow takes seconds to import: import it here with the keras code.
+            # from tensorflow import keras
             # gdmodel = keras.Sequential([
             #     keras.layers.Input(shape=(x_train.shape[1],)),
             #     keras.layers.Dense(y_test.shape[1], activation='sigmoid')
@@ -103,21 +107,25 @@ def main():
             # t_k.append(t_e - t_s)
 
 
-            t_s = time.time()
-            w, b, costs = model(x_train, y_train, epoch=gd_epoch, lr=0.005, print_cost=0, optimizer="GD")
-            t_e = time.time()
+            if i == 0:
+                # warmup: the first SGD run loads the compiled kernel.
+                model(x_train[:8], y_train[:8], epoch=1, print_cost=0, optimizer="SGD")
+
+            t_s = time.perf_counter()
+            w, b, costs = model(x_train, y_train, epoch=gd_epoch, lr=0.005, print_cost=0, optimizer="GD", seed=i)
+            t_e = time.perf_counter()
             gdacc.append(evaluate(w, b, x_test, y_test))
             t.append(t_e - t_s)
 
-            t_s = time.time()
-            w, b, costs = model(x_train, y_train, epoch=sgd_epoch, lr=0.005, print_cost=0, optimizer="SGD")
-            t_e = time.time()
+            t_s = time.perf_counter()
+            w, b, costs = model(x_train, y_train, epoch=sgd_epoch, lr=0.005, print_cost=0, optimizer="SGD", seed=i)
+            t_e = time.perf_counter()
             sgdacc.append(evaluate(w, b, x_test, y_test))
             t.append(t_e - t_s)
-            
-            t_s = time.time()
-            w, b, costs = model(x_train, y_train, epoch=bgd_epoch, batch=50, lr=0.005, print_cost=0, optimizer="BGD")
-            t_e = time.time()
+
+            t_s = time.perf_counter()
+            w, b, costs = model(x_train, y_train, epoch=bgd_epoch, batch=50, lr=0.005, print_cost=0, optimizer="BGD", seed=i)
+            t_e = time.perf_counter()
             bgdacc.append(evaluate(w, b, x_test, y_test))
             t.append(t_e - t_s)
 
@@ -151,7 +159,11 @@ def main():
 
         print("\n------ my logic ------")
 
-        print(f"training time: {time_rec}")
+        for name, times, acc in (("gd", time_rec[:, 0], gdacc), ("sgd", time_rec[:, 1], sgdacc),
+                                 ("bgd", time_rec[:, 2], bgdacc)):
+            r = summarize(times)
+            print(f"{name} training time: median {r['median']:.4f}s, iqr {r['iqr']:.4f}s, "
+                  f"min {r['min']:.4f}s, max {r['max']:.4f}s")
         print(f"gd mean: {gdacc.mean()}")
         print(f"gd min: {gdacc.min()}")
         print(f"gd max: {gdacc.max()}")
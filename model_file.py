@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+import os
+import json
+import zlib
+import numpy as np
+
+MAGIC = b"DSLRMDL\0"
+MODEL_VERSION = 1
+ALIGN = 64
+MODEL_NAME = ".model.bin"
+
+
+def align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save_model(path: str, w: np.ndarray, b: np.ndarray,
+               features: list[str], mean: np.ndarray, std: np.ndarray,
+               classes: list[str], dtype=np.float64,
+               arrays: dict[str, np.ndarray] = None, **meta) -> int:
+    """
+    write a model file:
+
+        magic (8 bytes) | header length (uint32 little endian) | json header
+        | w | b | mean | std | arrays...
+
+    the header holds the version, classes, features, dtype, the offset and
+    shape of every array and the crc32 of the array section. Every array
+    starts at a multiple of 64 bytes, so that load_model() can map it.
+
+    Args
+        w: weights (n_category, n_feature)
+        b: bias (n_category,)
+        features: selected feature names
+        mean, std: standardization of each feature
+        classes: category names
+        dtype: float dtype of w, b, mean and std
+        arrays: extra named arrays, stored with their own dtype
+        meta: extra json values of the header
+
+    Return
+        size of the file in bytes
+    """
+
+    dtype = np.dtype(dtype).newbyteorder("<")
+    w = np.asarray(w, dtype=dtype)
+    assert w.ndim == 2 and w.shape[1] == len(features), "invalid weight shape."
+
+    body = {
+        "w": w,
+        "b": np.asarray(b, dtype=dtype).reshape(-1),
+        "mean": np.asarray(mean, dtype=dtype),
+        "std": np.asarray(std, dtype=dtype),
+    }
+    for name, arr in (arrays or {}).items():
+        assert name not in body, f"reserved array name: {name}"
+        arr = np.asarray(arr)
+        body[name] = arr.astype(arr.dtype.newbyteorder("<"))
+
+    entries = {}
+    offset = 0
+    for name, arr in body.items():
+        entries[name] = {"offset": offset, "shape": list(arr.shape), "dtype": arr.dtype.str}
+        offset = align(offset + arr.nbytes)
+
+    payload = bytearray(offset)
+    for name, arr in body.items():
+        start = entries[name]["offset"]
+        payload[start:start + arr.nbytes] = np.ascontiguousarray(arr).tobytes()
+
+    header = {
+        "version": MODEL_VERSION,
+        "classes": list(classes),
+        "features": list(features),
+        "dtype": dtype.str,
+        "arrays": entries,
+        "crc32": zlib.crc32(payload),
+        "meta": meta,
+    }
+    text = json.dumps(header).encode()
+    # pad the header with spaces, so that the payload is aligned.
+    size = align(len(MAGIC) + 4 + len(text)) - len(MAGIC) - 4
+    text = text.ljust(size)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(text).to_bytes(4, "little"))
+        f.write(text)
+        f.write(payload)
+    os.replace(tmp, path)
+
+    return len(MAGIC) + 4 + len(text) + len(payload)
+
+
+def load_model(path: str, verify: bool = True) -> dict:
+    """
+    memory-map a file written by save_model() (read only). Needs neither
+    pickle nor pandas.
+
+    Return
+        header dict, with the arrays (w, b, mean, std, ...) added under their name.
+    """
+
+    buf = np.memmap(path, mode="r", dtype=np.uint8)
+    assert bytes(buf[:len(MAGIC)]) == MAGIC, f"{path}: not a model file."
+
+    size = int.from_bytes(bytes(buf[len(MAGIC):len(MAGIC) + 4]), "little")
+    start = len(MAGIC) + 4 + size
+    header = json.loads(bytes(buf[len(MAGIC) + 4:start]))
+
+    assert header["version"] <= MODEL_VERSION, \
+        f"{path}: model version {header['version']} is newer than {MODEL_VERSION}."
+    if verify:
+        assert zlib.crc32(buf[start:]) == header["crc32"], f"{path}: checksum mismatch."
+
+    model = dict(header)
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        offset = start + entry["offset"]
+        model[name] = buf[offset:offset + count * dtype.itemsize].view(dtype).reshape(entry["shape"])
+
+    return model
@@ -2,7 +2,7 @@
 
 import sys
 import pandas as pd
-from load_csv import load
+from load_csv import load, HOGWARTS_SCHEMA
 import matplotlib.pyplot as plt
 import seaborn as sns
 from logreg_train import data_fill
@@ -10,8 +10,8 @@ from logreg_train import data_fill
 
 def main():
     try:
-        data = load("datasets/dataset_train.csv")
-        # data = load("datasets/dataset_test.csv")
+        data = load("datasets/dataset_train.csv", HOGWARTS_SCHEMA, cache=True)
+        # data = load("datasets/dataset_test.csv", HOGWARTS_SCHEMA, cache=True)
 
         Gryffindor1 = ["Flying"]
         Gryffindor2 = ["Transfiguration"]
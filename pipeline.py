@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+
+import copy
+import numpy as np
+from typing import Iterable, Iterator
+
+CHUNKSIZE = 65536
+
+STRATEGIES = ["mean", "median"]
+
+# rank error of the streamed median fill
+MEDIAN_ERROR = 0.001
+
+# target: source. NaN of target is filled by a line fitted on source
+# (Defense Against the Dark Arts = -Astronomy / 100).
+HOGWARTS_DERIVED = {"Defense Against the Dark Arts": "Astronomy"}
+
+
+class Preprocessor:
+    """
+    imputation and Z score of the selected features, fitted once, saved
+    with the model and applied by train and predict alike.
+
+    transform() takes the raw `columns` (the features, then the source
+    columns of derived features) and fills, derives and standardizes them
+    in one pass over each chunk. Only fit() needs pandas (any DataFrame),
+    so predict can use it with NumPy only. fit_impute() and fit_scale()
+    take chunk iterators, so a dataset larger than RAM can be fitted in
+    two streaming passes (see feature_store.write_store_csv()).
+    """
+
+    def __init__(self, features: list[str], strategy: str = "mean",
+                 derived: dict[str, str] = None):
+        """
+        Args
+            features: selected feature names
+            strategy: fill value of a missing feature, one of STRATEGIES
+            derived: {target: source}. missing target values are predicted
+                     from source by a fitted line, when source is present.
+        """
+
+        assert strategy in STRATEGIES, f"invalid strategy: {strategy}"
+
+        self.features = list(features)
+        self.strategy = strategy
+        # only the derived features that are selected
+        self.derived = {t: s for t, s in (derived or {}).items() if t in self.features}
+        sources = [s for s in self.derived.values() if s not in self.features]
+        self.columns = self.features + list(dict.fromkeys(sources))
+
+        # (target index, source index in columns, slope, intercept)
+        self.lines = []
+        self.fill = None
+        self.mean = None
+        self.std = None
+
+    def fit(self, data, chunksize: int = CHUNKSIZE) -> "Preprocessor":
+        """fit on data (DataFrame with the raw columns). Return self."""
+
+        self.fit_impute(self.frame_chunks(data, chunksize))
+        self.fit_scale(self.frame_chunks(data, chunksize))
+        return self
+
+    def fit_array(self, x: np.ndarray) -> "Preprocessor":
+        """fit on the raw columns x (n_data, len(columns)), left unchanged. Return self."""
+
+        self.fit_impute([x])
+        self.fit_scale([x.copy()])
+        return self
+
+    def fit_impute(self, chunks: Iterable[np.ndarray]) -> None:
+        """
+        fill values and derived lines, in one pass over chunks of the raw
+        columns (n_data, len(columns)), NaN ignored. The chunks are not modified.
+        The fill is the mean of each feature, or its median approximated
+        by a KLLSketch (rank error MEDIAN_ERROR). The lines are least squares
+        on the rows having both target and source, from merged co-moments.
+        """
+
+        from sketch import Moments, KLLSketch
+
+        n_feature = len(self.features)
+        moments = Moments(n_feature)
+        sketches = [KLLSketch(MEDIAN_ERROR, seed=0) for _ in range(n_feature)]
+        index = {col: i for i, col in enumerate(self.columns)}
+        pairs = [(index[t], index[s]) for t, s in self.derived.items()]
+        # per line: count, mean of source, mean of target, sum of squares, sum of products
+        stats = np.zeros((len(pairs), 5))
+
+        for chunk in chunks:
+            if self.strategy == "median":
+                for i, sketch in enumerate(sketches):
+                    sketch.update(chunk[:, i])
+            else:
+                moments.update(chunk[:, :n_feature])
+
+            for line, (t, s) in zip(stats, pairs):
+                pair = chunk[:, [s, t]]
+                pair = pair[~np.isnan(pair).any(axis=1)]
+                if len(pair):
+                    merge_line(line, pair)
+
+        if self.strategy == "median":
+            self.fill = np.array([sketch.quantile(0.5)[0] for sketch in sketches])
+        else:
+            self.fill = moments.mean
+
+        self.lines = []
+        for (n, mean_s, mean_t, ss, st), (t, s) in zip(stats, pairs):
+            if n > 1 and ss > 0:
+                slope = st / ss
+                intercept = mean_t - slope * mean_s
+            else:
+                slope, intercept = 0.0, self.fill[t]
+            self.lines.append((t, s, float(slope), float(intercept)))
+
+    def fit_scale(self, chunks: Iterable[np.ndarray]) -> None:
+        """mean and std of the imputed features, for the Z score. chunks are imputed in place."""
+
+        from sketch import Moments
+
+        moments = Moments(len(self.features))
+        for chunk in chunks:
+            moments.update(self.impute(chunk))
+        self.mean, self.std = moments.mean, moments.std()
+
+    def update(self, data, n: int, chunksize: int = CHUNKSIZE) -> "Preprocessor":
+        """
+        Preprocessor of the n rows self was fitted on plus the rows of data,
+        without reading the old rows: mean/std are merged, a mean fill is
+        weighted by rows, a median fill and the derived lines are kept.
+        """
+
+        new = copy.copy(self)
+        if self.strategy == "mean":
+            new.fit_impute(self.frame_chunks(data, chunksize))
+            new.fill = (self.fill * n + new.fill * len(data)) / (n + len(data))
+            new.lines = self.lines
+        new.fit_scale(self.frame_chunks(data, chunksize))
+        new.mean, new.std = merge_standardize(self.mean, self.std, n, new.mean, new.std, len(data))
+        return new
+
+    def frame_chunks(self, data, chunksize: int = CHUNKSIZE) -> Iterator[np.ndarray]:
+        """yield the raw columns of data (DataFrame) as float64 arrays of chunksize rows."""
+
+        for start in range(0, len(data), chunksize):
+            yield data[self.columns].iloc[start:start + chunksize].to_numpy(dtype=np.float64)
+
+    def impute(self, x: np.ndarray) -> np.ndarray:
+        """
+        fill missing values of x (n_data, len(columns)) in place.
+        Return the feature columns (n_data, n_feature), a view of x.
+        """
+
+        for target, source, slope, intercept in self.lines:
+            missing = np.isnan(x[:, target])
+            x[missing, target] = x[missing, source] * slope + intercept
+
+        x = x[:, :len(self.features)]
+        np.copyto(x, self.fill, where=np.isnan(x))
+        return x
+
+    def transform(self, x: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        impute and standardize raw x (n_data, len(columns)), in place.
+        Return the standardized features (n_data, n_feature), in out if given.
+        """
+
+        x = self.impute(x)
+        x -= self.mean
+        x /= self.std
+        if out is None:
+            return x
+        out[...] = x
+        return out
+
+    def transform_frame(self, data, out: np.ndarray = None, dtype=np.float64,
+                        chunksize: int = CHUNKSIZE) -> np.ndarray:
+        """transform() data (DataFrame) chunk by chunk into out (n_data, n_feature)."""
+
+        if out is None:
+            out = np.empty((len(data), len(self.features)), dtype=dtype)
+
+        start = 0
+        for chunk in self.frame_chunks(data, chunksize):
+            self.transform(chunk, out[start:start + len(chunk)])
+            start += len(chunk)
+        return out
+
+    def select(self, features: list[str]) -> "Preprocessor":
+        """fitted Preprocessor of a subset of the features (ex. the ones a sparse model uses)."""
+
+        index = [self.features.index(col) for col in features]
+        pre = Preprocessor(features, self.strategy, self.derived)
+        column = {col: i for i, col in enumerate(pre.columns)}
+        pre.lines = [(column[self.columns[t]], column[self.columns[s]], slope, intercept)
+                     for t, s, slope, intercept in self.lines if self.columns[t] in pre.derived]
+        pre.fill, pre.mean, pre.std = self.fill[index], self.mean[index], self.std[index]
+        return pre
+
+    def config(self) -> dict:
+        """json description, saved in the model file header."""
+
+        return {
+            "strategy": self.strategy,
+            "columns": self.columns,
+            "derived": [[self.columns[t], self.columns[s], slope, intercept]
+                        for t, s, slope, intercept in self.lines],
+        }
+
+    def model_args(self) -> dict:
+        """features, mean, std and pipeline arguments of save_model()."""
+
+        return {
+            "features": self.features,
+            "mean": self.mean,
+            "std": self.std,
+            "arrays": {"fill": self.fill},
+            "pipeline": self.config(),
+        }
+
+    @classmethod
+    def from_model(cls, params: dict) -> "Preprocessor":
+        """Preprocessor of a loaded model file. Older files fill with the mean."""
+
+        config = params["meta"].get("pipeline", {"strategy": "mean", "derived": []})
+        pre = cls(params["features"], config["strategy"], {t: s for t, s, _, _ in config["derived"]})
+        index = {col: i for i, col in enumerate(pre.columns)}
+        pre.lines = [(index[t], index[s], slope, intercept) for t, s, slope, intercept in config["derived"]]
+        pre.mean = np.asarray(params["mean"], dtype=np.float64)
+        pre.std = np.asarray(params["std"], dtype=np.float64)
+        pre.fill = np.asarray(params["fill"], dtype=np.float64) if "fill" in params else pre.mean
+        return pre
+
+
+def merge_line(line: np.ndarray, pair: np.ndarray) -> None:
+    """
+    merge the rows pair (n_data, 2) = (source, target) into the co-moments
+    line = [count, mean source, mean target, sum of squares of source,
+    sum of products], in place (pairwise update of Chan et al.).
+    """
+
+    n, mean_s, mean_t, ss, st = line
+    m = len(pair)
+    mean = pair.mean(axis=0)
+    d = pair - mean
+    ds, dt = mean[0] - mean_s, mean[1] - mean_t
+    ratio = m / (n + m)
+
+    line[0] = n + m
+    line[1] = mean_s + ds * ratio
+    line[2] = mean_t + dt * ratio
+    line[3] = ss + d[:, 0] @ d[:, 0] + ds * ds * n * ratio
+    line[4] = st + d[:, 0] @ d[:, 1] + ds * dt * n * ratio
+
+
+def merge_standardize(mean: np.ndarray, std: np.ndarray, n: int,
+                      new_mean: np.ndarray, new_std: np.ndarray, new_n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Args
+        mean, std, n: Z score mean and std (of the filled columns) of n rows
+        new_mean, new_std, new_n: the same, of new_n other rows
+
+    Return
+        tuple(mean, std) of the n + new_n rows, without reading the old rows.
+        each part counts as its mean-filled columns.
+    """
+
+    from sketch import Moments
+
+    parts = []
+    for m, s, count in ((mean, std, n), (new_mean, new_std, new_n)):
+        moments = Moments(len(m))
+        moments.count[:] = count
+        moments.mean = np.array(m, dtype=np.float64)
+        moments.m2 = np.asarray(s, dtype=np.float64) ** 2 * (count - 1)
+        parts.append(moments)
+
+    parts[0].merge(parts[1])
+    return parts[0].mean, parts[0].std()
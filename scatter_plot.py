@@ -5,7 +5,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from itertools import combinations
-from load_csv import load
+from load_csv import load, HOGWARTS_SCHEMA
 from logreg_train import data_fill
 
 
@@ -39,8 +39,8 @@ def answer(data: pd.DataFrame, lst: list[str]) -> None:
 
 def main():
     try:
-        data = load("datasets/dataset_train.csv")
-        # data = load("datasets/dataset_test.csv")
+        data = load("datasets/dataset_train.csv", HOGWARTS_SCHEMA, cache=True)
+        # data = load("datasets/dataset_test.csv", HOGWARTS_SCHEMA, cache=True)
 
         # data.dropna(inplace=True)
         data_fill(data)
@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+
+import sys
+import itertools
+import numpy as np
+import pandas as pd
+from load_csv import load, get_cur_dir, HOGWARTS_SCHEMA
+from feature_store import encode_labels, one_hot
+from model_file import MODEL_NAME
+from pipeline import Preprocessor, HOGWARTS_DERIVED
+from logreg_train import sigmoid, get_feature_data, save, EPS
+
+LR_GRID = [0.03, 0.1, 0.3, 1.0, 3.0]
+L2_GRID = [0.0, 1e-4, 1e-3, 1e-2]
+
+
+def grid(**values: list) -> list[dict]:
+    """every combination of the given values. ex. grid(lr=[0.1, 1], l2=[0, 1e-3])"""
+
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*values.values())]
+
+
+def random_configs(n: int, lr: tuple = (1e-2, 3.0), l2: tuple = (1e-5, 1e-1),
+                   seed: int = None) -> list[dict]:
+    """n configurations with lr and l2 drawn log-uniformly from their (low, high) range."""
+
+    rng = np.random.default_rng(seed)
+
+    def log_uniform(low, high):
+        return np.exp(rng.uniform(np.log(low), np.log(high), n))
+
+    return [dict(lr=float(a), l2=float(b)) for a, b in zip(log_uniform(*lr), log_uniform(*l2))]
+
+
+def kfold(n: int, k: int = 5, seed: int = None) -> list[tuple[np.ndarray, np.ndarray]]:
+    """(train index, validation index) of k shuffled folds of n rows."""
+
+    order = np.random.default_rng(seed).permutation(n)
+    parts = np.array_split(order, k)
+    return [(np.concatenate(parts[:i] + parts[i + 1:]), parts[i]) for i in range(k)]
+
+
+def fit_stats(x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """mean and std of the mean-filled columns of x (n_data, n_feature), as a mean fill Preprocessor."""
+
+    mean = np.nanmean(x, axis=0)
+    return mean, np.sqrt(np.nansum((x - mean) ** 2, axis=0) / (len(x) - 1))
+
+
+def standardize(x: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+    """fill NaN with mean and return the Z score (new array)."""
+
+    return (np.where(np.isnan(x), mean, x) - mean) / std
+
+
+def stacked_fit(X: np.ndarray, Y: np.ndarray,
+                W: np.ndarray, B: np.ndarray,
+                lr: np.ndarray, l2: np.ndarray,
+                epoch: int,
+                mask: np.ndarray = None) -> None:
+    """
+    full batch gradient descent of n_model models on the same data at once,
+    with one matmul per step for all of them. (in place)
+
+    Args
+        X: train data X (n_data, n_feature)
+        Y: one hot train data Y (n_data, n_category)
+        W: weights (n_model, n_category, n_feature)
+        B: bias (n_model, n_category)
+        lr: learning rate of each model (n_model,)
+        l2: L2 penalty of each model (n_model,)
+        epoch: number of iterations
+        mask: 0/1 features used by each model (n_model, n_feature), or None
+              for all. weights of unused features stay as they are.
+    """
+
+    n_model, n_category, n_feature = W.shape
+    m = X.shape[0]
+    lr_w = lr[:, None, None]
+    l2_w = l2[:, None, None]
+
+    # work buffers, allocated once. W, B are viewed as one (n_model * n_category) model.
+    Z = np.empty((m, n_model * n_category))
+    Z3 = Z.reshape(m, n_model, n_category)
+    dW = np.empty_like(W)
+    dW2 = dW.reshape(-1, n_feature)
+    W2 = W.reshape(-1, n_feature)
+    B1 = B.reshape(-1)
+    Y = Y[:, None, :]
+    if mask is not None:
+        mask = mask[:, None, :]
+
+    for _ in range(epoch):
+        # A - Y of every model
+        np.matmul(X, W2.T, out=Z)
+        Z += B1
+        np.clip(Z, -32, 32, out=Z)
+        np.negative(Z, out=Z)
+        np.exp(Z, out=Z)
+        Z += 1
+        np.reciprocal(Z, out=Z)
+        Z3 -= Y
+
+        np.matmul(Z.T, X, out=dW2)
+        dW /= m
+        dW += l2_w * W
+        if mask is not None:
+            dW *= mask
+        W -= lr_w * dW
+        B -= lr[:, None] * Z3.sum(axis=0) / m
+
+
+def stacked_score(X: np.ndarray, y: np.ndarray,
+                  W: np.ndarray, B: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return
+        tuple(cost, accuracy) of every model (n_model,) on X and class index y.
+    """
+
+    n_model, n_category, n_feature = W.shape
+    logits = (X @ W.reshape(-1, n_feature).T + B.reshape(-1)).reshape(len(X), n_model, n_category)
+    A = sigmoid(logits)
+    Y = one_hot(y, n_category).astype(bool)[:, None, :]
+
+    cost = -np.where(Y, np.log(A + EPS), np.log(1 - A + EPS)).sum(axis=2).mean(axis=0)
+    accuracy = np.mean(np.argmax(logits, axis=2) == y[:, None], axis=0) * 100
+    return cost, accuracy
+
+
+def successive_halving(x: np.ndarray, y: np.ndarray, n_category: int,
+                       configs: list[dict],
+                       k: int = 5,
+                       min_epoch: int = 30,
+                       max_epoch: int = 1000,
+                       eta: int = 3,
+                       seed: int = None,
+                       pipeline: Preprocessor = None) -> dict:
+    """
+    k-fold cross-validation of every config with successive halving: all
+    configs train min_epoch epochs, the best 1/eta (mean validation cost)
+    go on to eta times more epochs, and so on up to max_epoch. Every fold
+    is preprocessed with a pipeline fitted on its own train rows, once.
+
+    Args
+        x: raw columns with NaN (n_data, n_column): pipeline.columns, or
+           the features without pipeline
+        y: class index (n_data,)
+        n_category: number of categories
+        configs: list of {"lr", "l2"}
+        k: number of folds
+        min_epoch, max_epoch: epochs of the first and the last round
+        eta: reduction factor between rounds
+        pipeline: Preprocessor (not fitted) to fit on the train rows of each
+                  fold, as the saved model does. None: mean fill and Z score.
+
+    Return
+        {"config", "epoch", "cost", "accuracy", "history"}
+        cost/accuracy: mean validation cost and accuracy (%) of the best config.
+        history: alive configs, epochs and costs of every round.
+    """
+
+    n_feature = x.shape[1] if pipeline is None else len(pipeline.features)
+    folds = []
+    for train_idx, val_idx in kfold(len(x), k, seed):
+        if pipeline is None:
+            mean, std = fit_stats(x[train_idx])
+            x_train, x_val = standardize(x[train_idx], mean, std), standardize(x[val_idx], mean, std)
+        else:
+            fold = Preprocessor(pipeline.features, pipeline.strategy, pipeline.derived).fit_array(x[train_idx])
+            x_train = np.ascontiguousarray(fold.transform(x[train_idx]))
+            x_val = np.ascontiguousarray(fold.transform(x[val_idx]))
+        folds.append((x_train, one_hot(y[train_idx], n_category), x_val, y[val_idx]))
+
+    lr = np.array([c["lr"] for c in configs], dtype=np.float64)
+    l2 = np.array([c.get("l2", 0.0) for c in configs], dtype=np.float64)
+    W = np.zeros((k, len(configs), n_category, n_feature))
+    B = np.zeros((k, len(configs), n_category))
+    cost = np.full(len(configs), np.inf)
+    accuracy = np.zeros(len(configs))
+
+    alive = np.arange(len(configs))
+    done, budget = 0, min(min_epoch, max_epoch)
+    history = []
+    while True:
+        fold_cost = np.empty((k, len(alive)))
+        fold_accuracy = np.empty((k, len(alive)))
+        for f, (x_train, y_train, x_val, y_val) in enumerate(folds):
+            w, b = W[f, alive], B[f, alive]
+            stacked_fit(x_train, y_train, w, b, lr[alive], l2[alive], budget - done)
+            W[f, alive], B[f, alive] = w, b
+            fold_cost[f], fold_accuracy[f] = stacked_score(x_val, y_val, w, b)
+
+        # diverged models have a NaN cost: they go last.
+        cost[alive] = np.nan_to_num(fold_cost.mean(axis=0), nan=np.inf)
+        accuracy[alive] = fold_accuracy.mean(axis=0)
+        history.append({"epoch": budget, "configs": alive.tolist(), "cost": cost[alive].tolist()})
+
+        if len(alive) == 1 or budget >= max_epoch:
+            break
+        alive = alive[np.argsort(cost[alive], kind="stable")[:max(1, len(alive) // eta)]]
+        done, budget = budget, min(budget * eta, max_epoch)
+
+    best = alive[np.argmin(cost[alive])]
+    return {
+        "config": configs[best],
+        "epoch": budget,
+        "cost": float(cost[best]),
+        "accuracy": float(accuracy[best]),
+        "history": history,
+    }
+
+
+def search(data: pd.DataFrame, features: list[str], configs: list[dict],
+           label: str = "Hogwarts House", path: str = None, **kwargs) -> dict:
+    """
+    successive_halving() over the labeled rows of data, each fold through
+    its own fit of the model pipeline, then train the best config on all
+    of them, through the pipeline fitted on all of them, and save it to
+    the model file path.
+
+    Return
+        result of successive_halving()
+    """
+
+    data = data[data[label].notna()]
+    pipeline = Preprocessor(features, derived=HOGWARTS_DERIVED)
+    x = data[pipeline.columns].to_numpy(dtype=np.float64)
+    y, classes = encode_labels(data[label])
+
+    result = successive_halving(x, y, len(classes), configs, pipeline=pipeline, **kwargs)
+
+    pipeline.fit(data)
+    W = np.zeros((1, len(classes), len(features)))
+    B = np.zeros((1, len(classes)))
+    config = result["config"]
+    stacked_fit(pipeline.transform_frame(data), one_hot(y, len(classes)), W, B,
+                np.array([config["lr"]]), np.array([config.get("l2", 0.0)]), result["epoch"])
+
+    if path is not None:
+        save(path, W[0], B[0], pipeline, classes, n_rows=len(data),
+             search={k: v for k, v in result.items() if k != "history"})
+    return result
+
+
+def main():
+    """hyperparameter search program for dslr.
+
+usage: python3 search.py [train_file] [n_random]
+       grid search of LR_GRID x L2_GRID, or n_random random configs, with
+       5-fold cross-validation. The best model is saved as the model file."""
+
+    try:
+        assert len(sys.argv) in (2, 3), "usage: python3 search.py [train_file] [n_random]."
+
+        data = load(sys.argv[1], HOGWARTS_SCHEMA, cache=True)
+        assert data is not None, "data load failure."
+        _, features = get_feature_data(data)
+
+        if len(sys.argv) == 3:
+            configs = random_configs(int(sys.argv[2]), seed=0)
+        else:
+            configs = grid(lr=LR_GRID, l2=L2_GRID)
+
+        path = get_cur_dir() + "/" + MODEL_NAME
+        result = search(data, features, configs, path=path, seed=0)
+
+        for r in result["history"]:
+            print(f"epoch {r['epoch']:5d}: {len(r['configs']):3d} configs, best cost {min(r['cost']):.5f}")
+        print(f"best: {result['config']}, {result['epoch']} epochs, "
+              f"cv cost {result['cost']:.5f}, cv accuracy {result['accuracy']:.2f}%")
+        print(f"Model saved to {path}")
+
+    except Exception as e:
+        print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+
+
+def create_shared(shape: tuple, dtype=np.float64, order: str = "C") -> tuple[SharedMemory, np.ndarray, tuple]:
+    """
+    Args
+        shape: array shape
+        dtype: array dtype
+        order: "C" (row major) or "F" (column major)
+
+    Return
+        tuple(shm, arr, spec)
+        arr: array backed by the shared memory block shm
+        spec: picklable description of arr for attach_shared()
+    """
+
+    dtype = np.dtype(dtype)
+    nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+    shm = SharedMemory(create=True, size=nbytes)
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf, order=order)
+    spec = (shm.name, tuple(shape), dtype.str, order)
+    return shm, arr, spec
+
+
+def share_array(x: np.ndarray, order: str = "C") -> tuple[SharedMemory, np.ndarray, tuple]:
+    """copy x into a new shared memory block. see create_shared()."""
+
+    shm, arr, spec = create_shared(x.shape, x.dtype, order)
+    arr[...] = x
+    return shm, arr, spec
+
+
+def attach_shared(spec: tuple) -> tuple[SharedMemory, np.ndarray]:
+    """
+    attach to an array made by create_shared() in another process.
+    the array is valid until shm.close() is called.
+    """
+
+    name, shape, dtype, order = spec
+    shm = SharedMemory(name=name)
+    arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, order=order)
+    return shm, arr
+
+
+def release(shm: SharedMemory) -> None:
+    """close and unlink a shared memory block made by this process."""
+
+    shm.close()
+    shm.unlink()
@@ -0,0 +1,304 @@
+#!/usr/bin/python3
+
+import numpy as np
+import pandas as pd
+
+
+class Moments:
+    """
+    Running count, mean, M2, min and max of every column.
+
+    Chunks are merged with the pairwise update of Chan et al., so mean and
+    std stay exact however the data is split.
+    """
+
+    def __init__(self, n_col: int):
+        self.count = np.zeros(n_col)
+        self.mean = np.zeros(n_col)
+        self.m2 = np.zeros(n_col)
+        self.min = np.full(n_col, np.inf)
+        self.max = np.full(n_col, -np.inf)
+
+    def update(self, arr: np.ndarray) -> None:
+        """add a chunk (n_data, n_col). NaN is treated as missing."""
+
+        count = arr.shape[0] - np.isnan(arr).sum(axis=0)
+        valid = count > 0
+        if not valid.any():
+            return
+
+        arr = arr[:, valid]
+        n = count[valid]
+        mean = np.nansum(arr, axis=0) / n
+        m2 = np.nansum((arr - mean) ** 2, axis=0)
+
+        chunk = Moments(len(n))
+        chunk.count, chunk.mean, chunk.m2 = n.astype(np.float64), mean, m2
+        chunk.min, chunk.max = np.nanmin(arr, axis=0), np.nanmax(arr, axis=0)
+        self.merge(chunk, valid)
+
+    def merge(self, other: "Moments", cols=slice(None)) -> None:
+        """merge moments of other into the given columns of self."""
+
+        na, nb = self.count[cols], other.count
+        n = na + nb
+        delta = other.mean - self.mean[cols]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.where(n > 0, nb / n, 0)
+
+        self.mean[cols] = self.mean[cols] + delta * ratio
+        self.m2[cols] = self.m2[cols] + other.m2 + delta ** 2 * na * ratio
+        self.count[cols] = n
+        self.min[cols] = np.minimum(self.min[cols], other.min)
+        self.max[cols] = np.maximum(self.max[cols], other.max)
+
+    def std(self) -> np.ndarray:
+        """sample standard deviation (ddof=1) of every column."""
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2 / (self.count - 1))
+
+
+def kll_k_from_error(error: float) -> int:
+    """return KLL parameter k for the given normalized rank error."""
+
+    if not 0 < error < 1:
+        raise ValueError("error should be in the interval (0, 1).")
+
+    # k=200 gives about 1.65% rank error with 99% confidence.
+    return max(8, int(np.ceil(200 * 0.0165 / error)))
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (Karnin, Lang, Liberty 2016).
+
+    Items at level h carry weight 2**h. A full level is sorted and every
+    other item (from a random offset) is promoted to the next level, so the
+    sketch keeps O(k log(n / k)) items however many values are added.
+    """
+
+    def __init__(self, error: float = 0.01, seed: int = None):
+        self.k = kll_k_from_error(error)
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.n = 0
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values: np.ndarray) -> None:
+        """add values. NaN is ignored."""
+
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        """merge other sketch into self."""
+
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self.compress()
+
+    def compress(self) -> None:
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+
+                items = np.sort(items)
+                # an odd item stays at this level.
+                odd = len(items) % 2
+                promoted = items[odd:][self.rng.integers(2)::2]
+                self.levels[h] = items[:odd]
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def quantile(self, q) -> np.ndarray:
+        """return approximate quantiles (q in [0, 1]). NaN if empty."""
+
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if self.n == 0:
+            return np.full(len(q), np.nan)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2 ** h) for h, v in enumerate(self.levels)])
+
+        order = np.argsort(items, kind="stable")
+        items = items[order]
+        cum = np.cumsum(weights[order])
+
+        idx = np.searchsorted(cum, q * (cum[-1] - 1) + 1)
+        return items[np.minimum(idx, len(items) - 1)]
+
+
+class SpaceSaving:
+    """
+    Bounded heavy-hitters counter (Metwally et al. 2005).
+
+    At most `capacity` values are tracked. Counts of tracked values may be
+    overestimated by at most `error`, and values that never reach
+    `error` occurrences can be dropped. When nothing was dropped the
+    counts are exact.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        if capacity < 1:
+            raise ValueError("capacity should be positive.")
+
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.error = 0
+        self.truncated = False
+
+    def update(self, values: pd.Series) -> None:
+        """add a chunk of values. NaN is ignored."""
+
+        self.merge_counts(values.value_counts(dropna=True, sort=False), 0, False)
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """merge other counter into self."""
+
+        self.merge_counts(other.counts, other.min_count(), other.truncated)
+        self.error = max(self.error, other.error)
+
+    def min_count(self) -> int:
+        """count assumed for values this counter does not track."""
+
+        if len(self.counts) < self.capacity:
+            return 0
+        return int(self.counts.min())
+
+    def merge_counts(self, counts: pd.Series, other_min: int, other_truncated: bool) -> None:
+        # a value missing from one summary may have occurred up to its
+        # minimum count there (Agarwal et al. 2012, mergeable summaries).
+        self_min = self.min_count()
+        index = self.counts.index.union(counts.index, sort=False)
+        merged = (
+            self.counts.reindex(index, fill_value=self_min) +
+            counts.reindex(index, fill_value=other_min)
+        )
+
+        if len(merged) > self.capacity:
+            merged = merged.sort_values(ascending=False, kind="stable")
+            self.error = max(self.error, int(merged.iloc[self.capacity]))
+            merged = merged.iloc[:self.capacity]
+            self.truncated = True
+
+        self.error = max(self.error, self_min, other_min)
+        self.truncated |= other_truncated
+        self.counts = merged
+
+    def top(self) -> tuple:
+        """return the most frequent value and its count. (None, 0) if empty."""
+
+        if len(self.counts) == 0:
+            return None, 0
+
+        idx = np.argmax(self.counts.to_numpy())
+        return self.counts.index[idx], int(self.counts.iloc[idx])
+
+
+class HyperLogLog:
+    """
+    Distinct count estimator (Flajolet et al. 2007) in 2**p registers.
+
+    The relative error is about 1.04 / sqrt(2**p). p=14 uses 16 KiB and
+    is about 0.8% off.
+    """
+
+    def __init__(self, p: int = 14):
+        if not 4 <= p <= 18:
+            raise ValueError("p should be in the interval [4, 18].")
+
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+
+    def update(self, values: pd.Series) -> None:
+        """add a chunk of values. NaN is ignored."""
+
+        values = values.dropna().to_numpy()
+        if len(values) == 0:
+            return
+
+        h = pd.util.hash_array(values)
+        idx = (h >> np.uint64(64 - self.p)).astype(np.intp)
+
+        # rank: position of the first 1 bit in the remaining 64 - p bits.
+        # keep 53 bits so that the float conversion in frexp is exact.
+        rest = (h << np.uint64(self.p)) >> np.uint64(11)
+        bit_len = np.frexp(rest.astype(np.float64))[1]
+        rank = np.where(rest > 0, 54 - bit_len, 64 - self.p + 1)
+        rank = np.minimum(rank, 64 - self.p + 1).astype(np.uint8)
+
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """merge other estimator into self."""
+
+        if other.p != self.p:
+            raise ValueError("cannot merge HyperLogLog of different precision.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        """return the estimated number of distinct values."""
+
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting for small cardinalities
+            estimate = m * np.log(m / zeros)
+
+        return int(round(estimate))
+
+
+class CategoricalSketch:
+    """
+    Fixed-memory count/unique/top/freq of a non-numeric column:
+    HyperLogLog for unique and SpaceSaving for top/freq.
+    unique is exact while SpaceSaving has not dropped any value.
+    """
+
+    def __init__(self, capacity: int = 1000, p: int = 14):
+        self.count = 0
+        self.distinct = HyperLogLog(p)
+        self.heavy = SpaceSaving(capacity)
+
+    def update(self, values: pd.Series) -> None:
+        """add a chunk of values. NaN is ignored."""
+
+        self.count += int(values.count())
+        self.distinct.update(values)
+        self.heavy.update(values)
+
+    def merge(self, other: "CategoricalSketch") -> None:
+        """merge other sketch into self."""
+
+        self.count += other.count
+        self.distinct.merge(other.distinct)
+        self.heavy.merge(other.heavy)
+
+    def stats(self) -> list:
+        """return count, unique, top, freq."""
+
+        if self.count == 0:
+            return [0, 0, np.nan, np.nan]
+
+        top, freq = self.heavy.top()
+        if self.heavy.truncated:
+            unique = self.distinct.count()
+        else:
+            unique = len(self.heavy.counts)
+        return [self.count, unique, top, freq]
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import contextlib
+
+# active Tracer, or None. Instrumented code only checks this global (or
+# calls span()), so that tracing off costs next to nothing.
+TRACER = None
+
+NULL_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """
+    collect timings, counters and memory samples as Chrome trace events,
+    written as JSON lines. export_chrome() makes the JSON array that
+    chrome://tracing, Perfetto and speedscope load.
+
+    spans are "X" (complete) events, counters and memory are "C" events.
+    timed() functions are summed and written as a counter by flush(), so
+    that per-batch calls do not make one event each.
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.events = []
+        self.timers = {}
+        self.pid = os.getpid()
+        self.t0 = time.perf_counter_ns()
+
+    def now(self) -> float:
+        """microseconds since the tracer started."""
+
+        return (time.perf_counter_ns() - self.t0) / 1e3
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            end = self.now()
+            self.events.append({
+                "name": name, "ph": "X", "ts": start, "dur": end - start,
+                "pid": self.pid, "tid": threading.get_ident(), "args": args,
+            })
+            if self.memory:
+                self.sample_memory(end)
+
+    def count(self, name: str, ts: float = None, **values) -> None:
+        self.events.append({
+            "name": name, "ph": "C", "ts": self.now() if ts is None else ts,
+            "pid": self.pid, "args": values,
+        })
+
+    def sample_memory(self, ts: float = None) -> None:
+        """counter of the resident and peak memory (MiB) of this process."""
+
+        try:
+            with open("/proc/self/status") as f:
+                status = dict(line.split(":", 1) for line in f)
+        except OSError:
+            return
+        self.count("memory", ts,
+                   rss_mib=int(status["VmRSS"].split()[0]) / 1024,
+                   peak_mib=int(status["VmHWM"].split()[0]) / 1024)
+
+    def timed(self, name: str, func):
+        """func, with its calls and wall time summed under name until flush()."""
+
+        timer = self.timers.setdefault(name, [0, 0])
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer[0] += time.perf_counter_ns() - start
+                timer[1] += 1
+
+        return wrapper
+
+    def flush(self) -> None:
+        """write the timed() sums as a "stage ms" counter and reset them."""
+
+        if self.timers:
+            self.count("stage ms", **{name: total / 1e6 for name, (total, _) in self.timers.items()})
+            self.count("stage calls", **{name: calls for name, (_, calls) in self.timers.items()})
+            for timer in self.timers.values():
+                timer[0] = timer[1] = 0
+
+    def __call__(self, event: str, info: dict) -> None:
+        """model() callback: record the values of each event as counters."""
+
+        self.count(event, **{k: v for k, v in info.items() if isinstance(v, (int, float))})
+
+    def write(self, path: str) -> None:
+        """write the events as JSON lines: one JSON object per line."""
+
+        with open(path, "w") as f:
+            for event in self.events:
+                f.write(json.dumps(event) + "\n")
+
+
+def span(name: str, **args):
+    """context manager timing a stage while tracing is on. No-op otherwise."""
+
+    if TRACER is None:
+        return NULL_SPAN
+    return TRACER.span(name, **args)
+
+
+def start(path: str, memory: bool = False) -> Tracer:
+    """start tracing; the trace is written to path by stop() or at exit."""
+
+    global TRACER
+    TRACER = Tracer(memory)
+    atexit.register(stop, path)
+    return TRACER
+
+
+def stop(path: str) -> None:
+    global TRACER
+    if TRACER is not None:
+        TRACER.write(path)
+        TRACER = None
+        print(f"trace saved to {path}", file=sys.stderr)
+
+
+def start_from_env() -> None:
+    """
+    start tracing if DSLR_TRACE is set to the trace path. DSLR_TRACE_MEMORY=1
+    also samples memory at the end of every span.
+    """
+
+    path = os.environ.get("DSLR_TRACE")
+    if path:
+        start(path, memory=os.environ.get("DSLR_TRACE_MEMORY", "") not in ("", "0"))
+
+
+def export_chrome(path: str, out: str) -> None:
+    """convert the JSON lines trace path to a Chrome trace file out ({"traceEvents": [...]})."""
+
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    with open(out, "w") as f:
+        json.dump({"traceEvents": events}, f)
+
+
+def main():
+    """
+usage: python3 telemetry.py trace.jsonl trace.json
+
+convert a trace to the Chrome trace format (chrome://tracing, Perfetto, speedscope)."""
+
+    try:
+        assert len(sys.argv) == 3, "usage: python3 telemetry.py trace.jsonl trace.json"
+        export_chrome(sys.argv[1], sys.argv[2])
+
+    except Exception as e:
+        print(f"{e.__class__.__name__}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import pytest
+import numpy as np
+from logreg_train import fast_SGD_optimizer, BGD_optimizer, get_sgd_kernel
+
+
+def make_data(n: int = 300, n_feature: int = 5, n_category: int = 4, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n, n_feature))
+    y = np.argmax(X @ rng.standard_normal((n_feature, n_category)), axis=1).astype(np.int8)
+    return X, y
+
+
+@pytest.mark.skipif(get_sgd_kernel() is None, reason="numba is not installed")
+@pytest.mark.parametrize("kwargs", [
+    {},
+    {"loss": "softmax"},
+    {"l1": 1e-2, "l2": 1e-2},
+    {"loss": "softmax", "l1": 1e-2, "l2": 1e-2},
+    {"l1": 0.3},
+])
+def test_fast_sgd_matches_batch_of_one(kwargs):
+    X, y = make_data()
+    w = np.zeros((4, X.shape[1]))
+    b = np.zeros(4)
+
+    w1, b1, _ = fast_SGD_optimizer(w, b, X, y, epoch=5, lr=0.05, shuffle=False, **kwargs)
+    w2, b2, _ = BGD_optimizer(w, b, X, y, epoch=5, batch=1, lr=0.05, shuffle=False, **kwargs)
+
+    np.testing.assert_allclose(w1, w2, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(b1, b2, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(w1 == 0, w2 == 0)
+
+
+@pytest.mark.skipif(get_sgd_kernel() is None, reason="numba is not installed")
+def test_fast_sgd_is_seeded():
+    X, y = make_data()
+    w = np.zeros((4, X.shape[1]))
+    b = np.zeros(4)
+
+    w1, b1, _ = fast_SGD_optimizer(w, b, X, y, epoch=3, lr=0.05, seed=1, loss="softmax")
+    w2, b2, _ = fast_SGD_optimizer(w, b, X, y, epoch=3, lr=0.05, seed=1, loss="softmax")
+
+    np.testing.assert_array_equal(w1, w2)
+    np.testing.assert_array_equal(b1, b2)